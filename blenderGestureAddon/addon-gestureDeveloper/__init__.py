@@ -19,12 +19,17 @@ sys.path.append(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentf
 # print(os.getcwd())
 
 import bpy
+import numpy
 import serial
-import yaml
+
+import gestureProtocol
+import gesturerConfigs
+import servoMap
+import gestureExport
+import previewStreamer
 
 import struct
 from time import sleep
-from math import degrees
 
 # Blender Addon internals, information about the addon
 bl_info = {  
@@ -68,70 +73,52 @@ def gesture_handler(scene):
 
     # Only handle the scene if it is within a gesture
     if GestureOperator.currentGesture != -1:
-        # Create an array to store the angles we get from the Blender scene, and a
-        # bool to see if we should send these values to the Arduino
-        newAngles = [0] * GestureOperator.numObjects
-        shouldResend = False
-
-        # Create the base for the CSV output for each servo (aka each Object)
-        # Will exist even for frames with no gesture, to make indexing into
-        # the CSV from the YAML start/end values easier
-        GestureOperator.csvOutput[scene.frame_current] = [0] * GestureOperator.numObjects
-
-        # Generalized loop for putting an arbitrary number of object parameters out 
-        # on the serial connection
-        for i in range(GestureOperator.numObjects):
-            object = bpy.data.objects[GestureOperator.objectNames[i]]
-            movement = degrees(object.rotation_euler[GestureOperator.objectAxes[i]])
-            servoAngle = int(GestureOperator.objectOffsets[i]) + int(GestureOperator.objectMultipliers[i]) * int(movement)
-            newAngles[i] = servoAngle
-
-            # Set the CSV output for the given servo and angle 
-            GestureOperator.csvOutput[scene.frame_current][i] = servoAngle
-
-            # If the angle of a motor has changed, rewrite them all to Arduino
-            if (servoAngle != GestureOperator.previousServoAngles[i]):
-                shouldResend = True
-                GestureOperator.previousServoAngles[i] = newAngles[i]
-
-        # If we should resend the motor positons, loop through and send each based
-        # on the motor identification scheme (addressing/switching)
+        # Map the rotation of every object to the angle of its servo at once
+        # (scaled, offset and clamped to the servo limits)
+        servos = GestureOperator.servoMap
+        rotations = [bpy.data.objects[servos.names[i]].rotation_euler[servos.axes[i]] for i in range(servos.numServos)]
+        newAngles = servos.anglesFromRotations(rotations)
+
+        # Set the CSV output for the frame
+        GestureOperator.csvOutput[scene.frame_current] = newAngles
+
+        # If the angle of a motor has changed, rewrite them all to Arduino
+        shouldResend = newAngles != GestureOperator.previousServoAngles
+        GestureOperator.previousServoAngles = newAngles
+
+        # If we should resend the motor positons, hand the whole frame to the
+        # preview streamer, which sends the newest frame on its own thread so
+        # Blender never waits on the Arduino
         if (shouldResend == True):
             print("Scene is: " + str(scene.frame_current))
-            for i in range(GestureOperator.numObjects):
-                # If we are addressing motors, first send "i"
-                if (GestureOperator.motorIdentification == "addressing"):
-                    serialPort.write(struct.pack('B', (181 + i)))
-                    serialRead = serialPort.read()
-                    # NOTE:
-                    # Need to check if it's a chr or "string of length 0" before
-                    # we print to stop getting that error and to see what's going on
-                    print("Address is: " + str(ord(serialRead)))
-                    if (ord(serialRead) != (181 + i)):
-                        stop_operator()
-                        print("Serial send not equal to serial return")
-                        break
-
-                serialPort.write(struct.pack('B', newAngles[i]))
-                # GestureOperator.previousServoAngles[i] = newAngles[i]
-                print("Write angle " + str(i) + " is: " + str(newAngles[i]))
-
-                serialRead = serialPort.read()
-                # NOTE:
-                # Need to check if it's a chr or "string of length 0" before
-                # we print to stop getting that error and to see what's going on
-                print("Read angle " + str(i) + " is: " + str(ord(serialRead)))
-                if (ord(serialRead) != newAngles[i]):
-                    stop_operator()
-                    print("Serial send not equal to serial return")
-                    break
+            GestureOperator.streamer.publish(newAngles)
             shouldResend = False
     # If we are not within a gesture, tell the user
     else:
         print("Frame " + str(scene.frame_current) + " is not within a gesture")
 
+    # The streamer stops when a frame was not delivered, so stop with it
+    if GestureOperator.streamer.failed == True:
+        stop_operator()
+        print("Serial send not equal to serial return")
+
    
 
+# send_angles(newAngles)
+#
+# Sends a frame of servo angles to the Arduino with the configured protocol 
+# (packet, or echo with addressing/switching), returning whether it was
+# delivered. Called on the preview streamer's thread.
+def send_angles(newAngles):
+    changed = None
+    if GestureOperator.deltaUpdates == True:
+        changed = gestureProtocol.deltaMask(newAngles, GestureOperator.deltaBase)
+    if gestureProtocol.sendFrame(serialPort, newAngles, GestureOperator.serialProtocol, GestureOperator.motorIdentification, changed):
+        GestureOperator.deltaBase = newAngles
+        return True
+    return False
+
+
 # GestureOperator class
 #
 # Blender Addons are implemented via Python classes, so we create a class here
@@ -146,21 +133,39 @@ class GestureOperator(bpy.types.Operator):
     configs = {}
     # Extracted configuration data
     numObjects = 0
-    objectNames = []
-    objectAxes = []
-    objectOffsets = []
-    objectMultipliers = []
+    # Mapping from the rotation of each object to the angle of its servo
+    servoMap = None
     previousServoAngles = []
     motorIdentification = ""
+    serialProtocol = ""
+    # Whether frames only carry the servos that changed, and the last angles
+    # confirmed by the Arduino that those changes are taken from
+    deltaUpdates = False
+    deltaBase = None
+    # Whether to ask the Arduino for a faster baud rate from baudRates
+    negotiateBaudRate = False
+    baudRates = []
+    # Sends the newest frame of the live preview to the Arduino at previewRate
+    # frames per second on a background thread, giving up on the Arduino
+    # after previewReplyTimeout seconds without an answer
+    previewRate = 30
+    previewReplyTimeout = 0.5
+    streamer = None
     numGestures = 0
     gestureFrames = [] 
     csvOutputName = ""
     shouldOutputCSV = False
+    binaryOutputName = ""
+    shouldOutputBinary = False
     gestureDelimiter = ""
     # Create a dictionary of values to be written out to CSVs
     csvOutput = {}
 
     currentGesture = -1
+    # Gesture of each frame from gestureLookupStart on (-1 for frames outside
+    # every gesture), built by build_gesture_index() when the configs load
+    gestureLookup = []
+    gestureLookupStart = 0
 
     # Boolean to see if the scene handler should be set or reset
     isHandling = False
@@ -173,28 +178,7 @@ class GestureOperator(bpy.types.Operator):
     def execute(self, context):
         # Check if we should load the configs (and do so if necessary)
         if GestureOperator.loadConfigs == True:
-            fileName = os.path.join(os.path.dirname(bpy.data.filepath), "gesturerConfigs.yaml")
-            fileStream = open(fileName).read()
-            GestureOperator.configs = yaml.load(fileStream, Loader=yaml.Loader)
-
-            # TODO: Put all of this within a try catch and catch KeyErrors for 
-            # improperly constructed YAML files
-            GestureOperator.objectNames = GestureOperator.configs["objectNames"]
-            GestureOperator.objectAxes = GestureOperator.configs["objectAxes"]
-            GestureOperator.objectOffsets = GestureOperator.configs["objectOffsets"]
-            GestureOperator.objectMultipliers = GestureOperator.configs["objectMultipliers"]
-            GestureOperator.numObjects = GestureOperator.configs["numObjects"]
-            GestureOperator.motorIdentification = GestureOperator.configs["motorIdentification"]
-            GestureOperator.numGestures = GestureOperator.configs["numGestures"]
-            GestureOperator.gestureFrames = GestureOperator.configs["gestureFrames"]
-            GestureOperator.csvOutputName = GestureOperator.configs["csvOutputName"]
-            GestureOperator.shouldOutputCSV = GestureOperator.configs["shouldOutputCSV"]
-            GestureOperator.gestureDelimiter = GestureOperator.configs["gestureDelimiter"]
-            GestureOperator.previousServoAngles = [0] * GestureOperator.numObjects
-            serialPort.port = GestureOperator.configs["serialPort"]
-            # Currently, only load the configs when the "Gesture Operator" 
-            # is first called
-            GestureOperator.loadConfigs = False
+            load_configs()
 
         # If we are not currently handling scene changes, set function "gesture_handler"
         # to be run every scene change
@@ -203,8 +187,18 @@ class GestureOperator(bpy.types.Operator):
             #   we know it's open to add our handler to the scene update. Need to
             #   find a better way than hardcoding a sleep value, but it works for now 
             serialPort.open()
+            # The Arduino's servo angles are unknown until a frame is confirmed
+            GestureOperator.deltaBase = None
             print("Opening Serial port, waiting for 2 seconds to connect...")
             sleep(2)
+            if GestureOperator.negotiateBaudRate == True:
+                baudRate = gestureProtocol.negotiateBaudRate(serialPort, GestureOperator.baudRates)
+                print("Communicating at " + str(baudRate) + " baud")
+            # Reads on the streamer's thread must give up eventually, or
+            # stopping the preview would wait on them forever
+            serialPort.timeout = GestureOperator.previewReplyTimeout
+            GestureOperator.streamer = previewStreamer.PreviewStreamer(send_angles, GestureOperator.previewRate)
+            GestureOperator.streamer.start()
             bpy.app.handlers.scene_update_pre.append(gesture_handler)
             GestureOperator.isHandling = True
         # If we were handling scene changes, remove our handler from the handler list
@@ -215,14 +209,54 @@ class GestureOperator(bpy.types.Operator):
         return {'FINISHED'}
       
 
+# load_configs()
+#
+# Reads gesturerConfigs.yaml from the folder of the .blend file into the 
+# GestureOperator class attributes.
+def load_configs():
+    global serialPort
+    fileName = os.path.join(os.path.dirname(bpy.data.filepath), "gesturerConfigs.yaml")
+    # The configs are checked against numObjects and numGestures when parsed,
+    # and cached until the file changes
+    GestureOperator.configs = gesturerConfigs.loadConfigs(fileName)
+
+    # TODO: Put all of this within a try catch and catch KeyErrors for 
+    # improperly constructed YAML files
+    GestureOperator.servoMap = servoMap.ServoMap.fromConfigs(GestureOperator.configs)
+    GestureOperator.numObjects = GestureOperator.configs["numObjects"]
+    GestureOperator.motorIdentification = GestureOperator.configs["motorIdentification"]
+    # Older configs predate the packet protocol, so default to the echo scheme
+    GestureOperator.serialProtocol = GestureOperator.configs.get("serialProtocol", "echo")
+    GestureOperator.deltaUpdates = GestureOperator.configs.get("deltaUpdates", False)
+    GestureOperator.numGestures = GestureOperator.configs["numGestures"]
+    GestureOperator.gestureFrames = GestureOperator.configs["gestureFrames"]
+    build_gesture_index()
+    GestureOperator.csvOutputName = GestureOperator.configs["csvOutputName"]
+    GestureOperator.shouldOutputCSV = GestureOperator.configs["shouldOutputCSV"]
+    GestureOperator.binaryOutputName = GestureOperator.configs.get("binaryOutputName", "animationOutput.gsb")
+    GestureOperator.shouldOutputBinary = GestureOperator.configs.get("shouldOutputBinary", False)
+    GestureOperator.gestureDelimiter = GestureOperator.configs["gestureDelimiter"]
+    GestureOperator.previousServoAngles = [0] * GestureOperator.numObjects
+    serialPort = gestureProtocol.serialPortFor(GestureOperator.configs["serialPort"],
+                                               GestureOperator.configs.get("baudRate", 9600), globalTimeout)
+    GestureOperator.negotiateBaudRate = GestureOperator.configs.get("negotiateBaudRate", False)
+    GestureOperator.baudRates = GestureOperator.configs.get("baudRates", [])
+    GestureOperator.previewRate = GestureOperator.configs.get("previewRate", 30)
+    GestureOperator.previewReplyTimeout = GestureOperator.configs.get("previewReplyTimeout", 0.5)
+    # Currently, only load the configs when the "Gesture Operator" 
+    # is first called
+    GestureOperator.loadConfigs = False
+
+
 # non_blocking_read()
 # 
 # Performs a non-blocking read on the global serialPort by setting the timeout
-# to 0, reading, and then setting the timeout back to the globalTimeout value.
+# to 0, reading, and then setting the timeout back to what it was.
 def non_blocking_read():
+    initialTimeout = serialPort.timeout
     serialPort.timeout = 0
     serialRead = serialPort.read()
-    serialPort.timeout = globalTimeout
+    serialPort.timeout = initialTimeout
 
     if (len(serialRead) > 0):
         print("Non-blocking read received: " + str(ord(serialRead)))
@@ -232,20 +266,43 @@ def non_blocking_read():
 
 
 
-def find_current_gesture(currentFrame):
-    
-    # Reset currentGesture to -1, will remain so if currentFrame is not within
-    # a gesture
-    # currentGesture = -1
-
-    # Check to see if the currentFrame is within any of the gestures' windows,
-    # and set the currentGesture if so
-    for i in range(GestureOperator.numGestures):
+# build_gesture_index()
+#
+# Builds the frame to gesture lookup used by find_current_gesture(), covering
+# the frames from the start of the earliest gesture to the end of the last.
+# Where gestures overlap, the frame belongs to the first in gestureFrames.
+def build_gesture_index():
+    gestureFrames = GestureOperator.gestureFrames[:GestureOperator.numGestures]
+    GestureOperator.gestureLookup = []
+    GestureOperator.gestureLookupStart = 0
+    if len(gestureFrames) == 0:
+        return
+
+    firstFrame = min([int(start) for start, end in gestureFrames])
+    lastFrame = max([int(end) for start, end in gestureFrames])
+    gestureLookup = [-1] * (lastFrame - firstFrame + 1)
+    # Fill in the later gestures first so earlier ones take precedence
+    for i in reversed(range(len(gestureFrames))):
         # Note, gestureFrames[i][0] is the startingFrame of gesture i and
         # gestureFrames[i][1] is the endingFrame of gesture i
-        if currentFrame >= GestureOperator.gestureFrames[i][0] and currentFrame <= GestureOperator.gestureFrames[i][1]:
-            GestureOperator.currentGesture = i
-            break
+        start = int(gestureFrames[i][0]) - firstFrame
+        end = int(gestureFrames[i][1]) - firstFrame
+        gestureLookup[start:end + 1] = [i] * (end - start + 1)
+
+    GestureOperator.gestureLookup = gestureLookup
+    GestureOperator.gestureLookupStart = firstFrame
+
+
+# find_current_gesture(currentFrame)
+#
+# Sets currentGesture to the gesture whose window currentFrame is within, or
+# to -1 if it is not within any gesture.
+def find_current_gesture(currentFrame):
+    index = currentFrame - GestureOperator.gestureLookupStart
+    if index >= 0 and index < len(GestureOperator.gestureLookup):
+        GestureOperator.currentGesture = GestureOperator.gestureLookup[index]
+    else:
+        GestureOperator.currentGesture = -1
 
 
 # stop_operator()
@@ -261,68 +318,165 @@ def stop_operator():
     for handlerID, function in enumerate(reversed(myHandlerList)):
         if function.__name__ == 'gesture_handler':
             myHandlerList.pop(numHandlers - 1 - handlerID)
+    # Let the frame being sent finish before closing the port
+    if GestureOperator.streamer is not None:
+        if not GestureOperator.streamer.stop(GestureOperator.previewReplyTimeout + 1.):
+            print("The preview is still waiting on the Arduino, closing the serial port anyway")
+        print(GestureOperator.streamer.report())
     serialPort.close()
     GestureOperator.isHandling = False
 
     # Tell the addon to reload the configs when it next executes
     GestureOperator.loadConfigs = True
 
-    # Write out the CSV animation output to a file
-    if GestureOperator.shouldOutputCSV == True:
-        # TODO: Write out animation output for each individual gesture into the same
-        # file with delimiters (?). DONE
-        # TODO: Access the gesture data in csvOutput based on the bounds in the YAML. DONE
-        # TODO: Translate all gesture data to starting at 0 while outputting. DONE
-        outputFilePath = os.path.join(os.path.dirname(bpy.data.filepath), "animationOutput.csv")
-        outputFile = open(outputFilePath, "w")
-
-        for gesture in range(GestureOperator.numGestures):
-            # Get scene information for the current gesture
-            gestureStart = GestureOperator.gestureFrames[gesture][0]
-            gestureEnd = GestureOperator.gestureFrames[gesture][1]
-            gestureLength = int(gestureEnd) - int(gestureStart)
-            # Translate each gesture so it starts at 0
-            offsetIndex = 0
-
-            # Range is not inclusive, so we loop over the start to end+1
-            for sceneIndex in range(gestureStart, (gestureEnd + 1)):
-                scene = GestureOperator.csvOutput[sceneIndex]
-                line = ""
-                line += str(offsetIndex) + ", "
-
-                # Write out the position of each object into columns of the CSV
-                for i in range(GestureOperator.numObjects):
-                    line += str(scene[i])
-                    if i < (GestureOperator.numObjects - 1):
-                        line += ", "
-
-                line += "\n"
-                outputFile.write(line)
-
-                offsetIndex += 1
-
-            # Delimit each gesture with the proper character
-            line = GestureOperator.gestureDelimiter
-            line += "\n"
-            outputFile.write(line)
-
-        outputFile.close()
-        print("File Closed")
+    # Write out the frames of each gesture that were recorded while scrubbing
+    # if set in the configs
+    if GestureOperator.shouldOutputCSV == True or GestureOperator.shouldOutputBinary == True:
+        write_gestures(recorded_frames(), GestureOperator.shouldOutputCSV, GestureOperator.shouldOutputBinary)
 
     # Reset the CSV dictionary
     GestureOperator.csvOutput = {}
 
 
+# gesture_frame_ranges()
+#
+# Frames of each gesture in the configs.
+def gesture_frame_ranges():
+    return [range(int(start), int(end) + 1) for start, end in GestureOperator.gestureFrames[:GestureOperator.numGestures]]
+
+
+# write_gestures(rows, shouldOutputCSV, shouldOutputBinary)
+#
+# Streams the servo angles of each frame of each gesture, in order, into the
+# CSV animation output and/or the binary gesture library next to the .blend
+# file. Returns the exporter, which reports the export throughput.
+def write_gestures(rows, shouldOutputCSV, shouldOutputBinary):
+    # TODO: Write out animation output for each individual gesture into the same
+    # file with delimiters (?). DONE
+    # TODO: Access the gesture data in csvOutput based on the bounds in the YAML. DONE
+    # TODO: Translate all gesture data to starting at 0 while outputting. DONE
+    outputDirectory = os.path.dirname(bpy.data.filepath)
+    csvFilePath = None
+    binaryFilePath = None
+    if shouldOutputCSV == True:
+        csvFilePath = os.path.join(outputDirectory, GestureOperator.csvOutputName)
+    if shouldOutputBinary == True:
+        binaryFilePath = os.path.join(outputDirectory, GestureOperator.binaryOutputName)
+
+    exporter = gestureExport.GestureExporter(csvFilePath, binaryFilePath, GestureOperator.numObjects,
+                                             [len(frameRange) for frameRange in gesture_frame_ranges()],
+                                             GestureOperator.gestureDelimiter, GestureOperator.configs.get("gestureNames"),
+                                             GestureOperator.configs.get("servoLimits"))
+    for row in rows:
+        exporter.writeFrame(row)
+    exporter.close()
+    print(exporter.report())
+    return exporter
+
+
+# recorded_frames()
+#
+# Servo angles of every frame of every gesture as recorded in csvOutput while
+# playing through the scene. Frames that were never played through are 
+# evaluated from the animation instead.
+def recorded_frames():
+    frames = [frame for frameRange in gesture_frame_ranges() for frame in frameRange]
+    missingFrames = [frame for frame in frames if frame not in GestureOperator.csvOutput]
+    bakedFrames = {}
+    if len(missingFrames) > 0:
+        print("Evaluating " + str(len(missingFrames)) + " frames that were not played through")
+        bakedFrames = dict(zip(missingFrames, bake_frames(missingFrames).tolist()))
+
+    for frame in frames:
+        if frame in GestureOperator.csvOutput:
+            yield GestureOperator.csvOutput[frame]
+        else:
+            yield bakedFrames[frame]
+
+
+# bake_object(object, axis, frames)
+#
+# Rotation in radians of an object about the axis at each of the frames, taken
+# straight from its F-curve without stepping the scene. Objects that are not
+# animated about the axis keep their current rotation.
+def bake_object(object, axis, frames):
+    fcurve = None
+    if object.animation_data is not None and object.animation_data.action is not None:
+        fcurve = object.animation_data.action.fcurves.find("rotation_euler", index=axis)
+    if fcurve is None:
+        return numpy.full(len(frames), object.rotation_euler[axis])
+    return numpy.array([fcurve.evaluate(frame) for frame in frames])
+
+
+# bake_frames(frames)
+#
+# Servo angles at each of the frames as a frames x servos array, mapped from
+# the rotations of the objects by the servo map the same way gesture_handler
+# does.
+def bake_frames(frames):
+    servos = GestureOperator.servoMap
+    rotations = numpy.zeros((len(frames), servos.numServos))
+    for i in range(servos.numServos):
+        rotations[:, i] = bake_object(bpy.data.objects[servos.names[i]], servos.axes[i], frames)
+    return servos.anglesFromRotations(rotations)
+
+
+# bake_gestures()
+#
+# Servo angles of every frame of every gesture, in order, evaluated in one
+# pass per object.
+def bake_gestures():
+    frames = [frame for frameRange in gesture_frame_ranges() for frame in frameRange]
+    return bake_frames(frames).tolist()
+
+
+# ExportGesturesOperator class
+#
+# Bakes every gesture in the configs straight from the animation and writes
+# out the CSV animation output and the binary gesture library, without 
+# playing through the scene or connecting to the Arduino.
+class ExportGesturesOperator(bpy.types.Operator):
+    # Blender Addon internals 
+    bl_idname = "object.export_gestures"
+    bl_label = "Export Gestures"
+
+    # execute(self, context)
+    #
+    # Run on execution of "Export Gestures". Required function.
+    def execute(self, context):
+        # Reload the configs, unless the Gesture Operator is running with them
+        if GestureOperator.isHandling == False:
+            load_configs()
+            # Load them again when the Gesture Operator next executes, as it
+            # does after stopping
+            GestureOperator.loadConfigs = True
+
+        # Write the outputs the configs ask for, or the csv file when they
+        # ask for neither, since exporting nothing would be pointless
+        shouldOutputCSV = GestureOperator.shouldOutputCSV
+        shouldOutputBinary = GestureOperator.shouldOutputBinary
+        if shouldOutputCSV == False and shouldOutputBinary == False:
+            shouldOutputCSV = True
+        exporter = write_gestures(bake_gestures(), shouldOutputCSV, shouldOutputBinary)
+        self.report({'INFO'}, exporter.report())
+        # Blender Python internals, must return {'FINISHED'}
+        return {'FINISHED'}
+
+
 # register()
 #
-# Registers the GestureOperator class with Blender. Required function. 
+# Registers the GestureOperator and ExportGesturesOperator classes with 
+# Blender. Required function. 
 def register():  
     bpy.utils.register_class(GestureOperator) 
+    bpy.utils.register_class(ExportGesturesOperator)
 
 # unregister()
 #
-# Unregisters the GestureOperator class with Blender.
+# Unregisters the GestureOperator and ExportGesturesOperator classes with
+# Blender.
 def unregister():  
+    bpy.utils.unregister_class(ExportGesturesOperator)
     bpy.utils.unregister_class(GestureOperator) 
 
 
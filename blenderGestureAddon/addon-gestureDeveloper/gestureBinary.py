@@ -0,0 +1,182 @@
+# gestureBinary.py
+#
+# Compact binary container for gesture libraries, written by the Blender addon
+# and convertGestures.py and memory mapped by pythonGesturer, so loading costs
+# the same however many gestures there are.
+#
+# The file is laid out as (all integers little endian)
+#   header:  magic "GSTR", version (u16), servo count (u16), gesture count (u32)
+#   limits:  lower and upper limit of each servo (u8 each), which every angle
+#            in the file was clamped to
+#   index:   for each gesture, the offset of its frames in the file (u64), its
+#            number of frames (u32) and its name (32 bytes, null padded)
+#   frames:  for each gesture, a packed frames x servos matrix of u8 angles
+
+import csv
+import struct
+
+MAGIC = b"GSTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+INDEX_ENTRY = struct.Struct("<QI32s")
+NAME_LENGTH = 32
+
+
+# GestureFileError
+#
+# Raised when a file is not a gesture library this module can read.
+class GestureFileError(Exception):
+    pass
+
+
+# defaultGestureNames(numGestures)
+#
+# Names for gestures that were not given one in the configs.
+def defaultGestureNames(numGestures):
+    return ["gesture" + str(i) for i in range(numGestures)]
+
+
+# encodeName(name)
+#
+# The name as UTF-8 of at most NAME_LENGTH bytes, cut before any character
+# that does not fit whole.
+def encodeName(name):
+    return name.encode("utf-8")[:NAME_LENGTH].decode("utf-8", "ignore").encode("utf-8")
+
+
+# clampRow(row, servoLimits)
+#
+# Clamps each angle of a frame to its servo's [lower, upper] limits.
+def clampRow(row, servoLimits):
+    return [min(max(int(row[i]), servoLimits[i][0]), servoLimits[i][1]) for i in range(len(servoLimits))]
+
+
+# normalizeLimits(numServos, servoLimits)
+#
+# The [lower, upper] limits of each servo within 0 to 180, from the configs.
+def normalizeLimits(numServos, servoLimits=None):
+    limits = [[0, 180] for i in range(numServos)]
+    if servoLimits is not None:
+        for i in range(min(numServos, len(servoLimits))):
+            limits[i] = [max(0, int(servoLimits[i][0])), min(180, int(servoLimits[i][1]))]
+    return limits
+
+
+# indexSize(numServos, numGestures)
+#
+# Size in bytes of everything before the frames.
+def indexSize(numServos, numGestures):
+    return HEADER.size + 2 * numServos + INDEX_ENTRY.size * numGestures
+
+
+# GestureFileWriter
+#
+# Writes a gesture library a frame at a time, so frames never have to be held
+# in memory. The number of frames of each gesture must be known up front, as
+# the index comes before the frames.
+class GestureFileWriter(object):
+
+    def __init__(self, fileName, numServos, frameCounts, names=None, servoLimits=None):
+        # Gestures without a name get a default one
+        names = list(names or []) + defaultGestureNames(len(frameCounts))[len(names or []):]
+        self.limits = normalizeLimits(numServos, servoLimits)
+        self.remainingFrames = sum(frameCounts)
+
+        self.outputFile = open(fileName, "wb")
+        self.outputFile.write(HEADER.pack(MAGIC, VERSION, numServos, len(frameCounts)))
+        for lower, upper in self.limits:
+            self.outputFile.write(struct.pack("BB", lower, upper))
+
+        offset = indexSize(numServos, len(frameCounts))
+        for gesture in range(len(frameCounts)):
+            self.outputFile.write(INDEX_ENTRY.pack(offset, frameCounts[gesture], encodeName(names[gesture])))
+            offset += frameCounts[gesture] * numServos
+
+    # writeFrame(row)
+    #
+    # Writes the angles of the next frame, clamped to the servo limits.
+    def writeFrame(self, row):
+        self.outputFile.write(bytearray(clampRow(row, self.limits)))
+        self.remainingFrames -= 1
+
+    def close(self):
+        self.outputFile.close()
+        if self.remainingFrames != 0:
+            raise GestureFileError("Gesture library closed with " + str(self.remainingFrames) + " frames unwritten")
+
+
+# writeGestureFile(fileName, gestures, numServos, names, servoLimits)
+#
+# Writes a gesture library, where gestures is a list with a list of frames
+# (each a list of servo angles) per gesture.
+def writeGestureFile(fileName, gestures, numServos, names=None, servoLimits=None):
+    writer = GestureFileWriter(fileName, numServos, [len(frames) for frames in gestures], names, servoLimits)
+    for frames in gestures:
+        for row in frames:
+            writer.writeFrame(row)
+    writer.close()
+
+
+# readGestureIndex(buffer)
+#
+# Reads the header, limits and index of a gesture library from a buffer (e.g.
+# an mmap of the file). Returns the servo count, the servo limits and a list
+# of (name, offset, numFrames) for each gesture.
+def readGestureIndex(buffer):
+    if len(buffer) < HEADER.size:
+        raise GestureFileError("File too short for a gesture library header")
+    magic, version, numServos, numGestures = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise GestureFileError("Not a gesture library file")
+    if version != VERSION:
+        raise GestureFileError("Unsupported gesture library version " + str(version))
+    if len(buffer) < indexSize(numServos, numGestures):
+        raise GestureFileError("File too short for its gesture index")
+
+    position = HEADER.size
+    limits = []
+    for i in range(numServos):
+        limits.append(list(struct.unpack_from("BB", buffer, position)))
+        position += 2
+
+    index = []
+    for gesture in range(numGestures):
+        offset, numFrames, name = INDEX_ENTRY.unpack_from(buffer, position)
+        position += INDEX_ENTRY.size
+        if offset + numFrames * numServos > len(buffer):
+            raise GestureFileError("Frames of gesture " + str(gesture) + " run past the end of the file")
+        # Files written before names were cut on character boundaries can
+        # end in part of a character
+        index.append((name.rstrip(b"\0").decode("utf-8", "ignore"), offset, numFrames))
+    return numServos, limits, index
+
+
+# readCsvGestures(fileName, numGestures, numServos, delimiter)
+#
+# Reads the CSV output of the addon into a list of frames per gesture, without
+# the timestep column.
+def readCsvGestures(fileName, numGestures, numServos, delimiter="*"):
+    gestures = [[] for gesture in range(numGestures)]
+    gestureCount = 0
+    csvInputFile = open(fileName, "rt")
+    for row in csv.reader(csvInputFile):
+        if len(row) == 0:
+            continue
+        if row[0].strip() == delimiter:
+            gestureCount += 1
+            if gestureCount == numGestures:
+                break
+        else:
+            gestures[gestureCount].append([int(value) for value in row[1:numServos + 1]])
+    csvInputFile.close()
+    return gestures
+
+
+# playbackGestures(gestures, reversedGestures)
+#
+# The gestures a playback sketch holds, in the order of the numbers the host
+# plays them by: the gestures in file order, then each gesture numbered in
+# reversedGestures with its frames backwards (the transition gestures
+# pythonGesturer plays backwards to go back between branches).
+def playbackGestures(gestures, reversedGestures):
+    return list(gestures) + [list(gestures[gestureId])[::-1] for gestureId in reversedGestures]
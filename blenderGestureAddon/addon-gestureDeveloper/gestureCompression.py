@@ -0,0 +1,169 @@
+# gestureCompression.py
+#
+# Compresses the frames of a gesture into the byte stream that the playback
+# firmware (motors_playback_template.ino) decodes from flash, and decodes it
+# again for checking. Each frame is stored as the change from the frame
+# before, in four bits per servo when the servos move slowly, and runs of
+# held poses or of steady movement are stored as a single byte.
+#
+# The stream is a sequence of operations, each an op byte followed by its
+# data:
+#   - HOLD_OP + n (0x00-0x3F): the previous frame, n + 1 times.
+#   - REPEAT_OP + n (0x40-0x7F): the last change again, n + 1 times.
+#   - NIBBLE_OP + n (0x80-0xBF): n + 1 frames, each a change of -8 to 7 per
+#     servo, two servos a byte (the even servo in the low nibble).
+#   - BYTE_OP + n (0xC0-0xFE): n + 1 frames, each a change of -128 to 127 per
+#     servo, a signed byte each.
+#   - KEYFRAME_OP (0xFF): the angle of each servo, a byte each.
+# Every gesture starts with a keyframe, which also resets the last change to
+# nothing. Works with either version of Python.
+
+HOLD_OP = 0x00
+REPEAT_OP = 0x40
+NIBBLE_OP = 0x80
+BYTE_OP = 0xC0
+KEYFRAME_OP = 0xFF
+# Most frames a single operation covers, by operation
+MAX_FRAMES = {HOLD_OP: 64, REPEAT_OP: 64, NIBBLE_OP: 64, BYTE_OP: 63, KEYFRAME_OP: 1}
+
+
+# frameSize(op, numServos)
+#
+# Bytes each frame of an operation takes after the op byte.
+def frameSize(op, numServos):
+    if op == NIBBLE_OP:
+        return (numServos + 1) // 2
+    if op in (BYTE_OP, KEYFRAME_OP):
+        return numServos
+    return 0
+
+
+# encodeFrame(op, values)
+#
+# The data of a single frame of a nibble, byte or keyframe operation.
+def encodeFrame(op, values):
+    if op == KEYFRAME_OP:
+        return bytearray(values)
+    if op == BYTE_OP:
+        return bytearray([value & 0xFF for value in values])
+    encoded = bytearray()
+    for i in range(0, len(values), 2):
+        high = values[i + 1] if i + 1 < len(values) else 0
+        encoded.append((values[i] & 0x0F) | ((high & 0x0F) << 4))
+    return encoded
+
+
+# frameOperation(previous, frame)
+#
+# The operation able to store a frame with the fewest bytes, ignoring runs,
+# and the change (or angles, for a keyframe) it stores.
+def frameOperation(previous, frame):
+    if previous is None:
+        return KEYFRAME_OP, list(frame)
+    change = [int(frame[i]) - int(previous[i]) for i in range(len(frame))]
+    if min(change) == 0 and max(change) == 0:
+        return HOLD_OP, change
+    if min(change) >= -8 and max(change) <= 7:
+        return NIBBLE_OP, change
+    if min(change) >= -128 and max(change) <= 127:
+        return BYTE_OP, change
+    return KEYFRAME_OP, list(frame)
+
+
+# runLength(operations, start, operation, limit)
+#
+# Number of frames from start on stored with the same operation and change.
+def runLength(operations, start, operation, limit):
+    run = 0
+    while start + run < len(operations) and run < limit and operations[start + run] == operation:
+        run += 1
+    return run
+
+
+# compressGesture(frames)
+#
+# The compressed stream of a gesture, given as a list of frames with an angle
+# (0-180) per servo.
+def compressGesture(frames):
+    if len(frames) == 0:
+        return bytearray()
+    numServos = len(frames[0])
+    operations = [frameOperation(frames[i - 1] if i > 0 else None, frames[i]) for i in range(len(frames))]
+
+    compressed = bytearray()
+    lastChange = None
+    i = 0
+    while i < len(operations):
+        op, values = operations[i]
+        if op == HOLD_OP:
+            run = runLength(operations, i, operations[i], MAX_FRAMES[HOLD_OP])
+            compressed.append(HOLD_OP + run - 1)
+            i += run
+            continue
+        if op != KEYFRAME_OP and values == lastChange:
+            run = runLength(operations, i, operations[i], MAX_FRAMES[REPEAT_OP])
+            compressed.append(REPEAT_OP + run - 1)
+            i += run
+            continue
+        if op == KEYFRAME_OP:
+            compressed.append(KEYFRAME_OP)
+            compressed += encodeFrame(KEYFRAME_OP, values)
+            lastChange = None
+            i += 1
+            continue
+
+        # Frames stored one after another, taking in frames that need fewer
+        # bits as long as they do not start a hold or a repeat worth the op
+        # bytes it takes to break off for it
+        size = frameSize(op, numServos)
+        run = 1
+        while i + run < len(operations) and run < MAX_FRAMES[op]:
+            nextOp, nextValues = operations[i + run]
+            if nextOp not in (HOLD_OP, op):
+                break
+            if nextOp == HOLD_OP or nextValues == operations[i + run - 1][1]:
+                if runLength(operations, i + run, operations[i + run], MAX_FRAMES[REPEAT_OP]) * size > 2:
+                    break
+            run += 1
+        compressed.append(op + run - 1)
+        for frame in range(i, i + run):
+            compressed += encodeFrame(op, operations[frame][1])
+        lastChange = operations[i + run - 1][1]
+        i += run
+    return compressed
+
+
+# decompressGesture(compressed, numServos)
+#
+# The frames of a compressed gesture, as lists of angles.
+def decompressGesture(compressed, numServos):
+    compressed = bytearray(compressed)
+    frames = []
+    angles = [0] * numServos
+    lastChange = [0] * numServos
+    position = 0
+    while position < len(compressed):
+        op = compressed[position]
+        position += 1
+        if op == KEYFRAME_OP:
+            angles = list(compressed[position:position + numServos])
+            lastChange = [0] * numServos
+            position += numServos
+            frames.append(list(angles))
+            continue
+
+        numFrames = (op & 0x3F) + 1
+        for frame in range(numFrames):
+            if op >= BYTE_OP:
+                lastChange = [value - 256 if value >= 128 else value for value in compressed[position:position + numServos]]
+                position += numServos
+            elif op >= NIBBLE_OP:
+                lastChange = []
+                for i in range(numServos):
+                    value = (compressed[position + i // 2] >> (4 * (i % 2))) & 0x0F
+                    lastChange.append(value - 16 if value >= 8 else value)
+                position += (numServos + 1) // 2
+            if op >= REPEAT_OP:
+                angles = [angles[i] + lastChange[i] for i in range(numServos)]
+            frames.append(list(angles))
+    return frames
@@ -0,0 +1,74 @@
+# gestureExport.py
+#
+# Writes the gestures exported by the Blender addon to the CSV animation
+# output and/or the binary gesture library as the frames are produced, so an
+# export never has to hold every frame or build the whole file in memory.
+
+import time
+
+import gestureBinary
+
+# Bytes of output buffered before they are written to disk
+BUFFER_SIZE = 1 << 16
+
+
+# GestureExporter
+#
+# Frames are passed to writeFrame() in order, gesture after gesture, and the
+# number of frames of each gesture must be known up front. The CSV has a row
+# per frame with its index within the gesture and the angle of each servo,
+# and a row with the delimiter after each gesture.
+class GestureExporter(object):
+
+    def __init__(self, csvFileName, binaryFileName, numServos, frameCounts, delimiter="*", names=None,
+                 servoLimits=None):
+        self.frameCounts = frameCounts
+        self.delimiter = delimiter
+        self.csvFile = None
+        self.binaryWriter = None
+        if csvFileName is not None:
+            self.csvFile = open(csvFileName, "w", BUFFER_SIZE)
+        if binaryFileName is not None:
+            self.binaryWriter = gestureBinary.GestureFileWriter(binaryFileName, numServos, frameCounts, names, servoLimits)
+
+        # Gesture being written and index of the next frame within it
+        self.gesture = 0
+        self.gestureFrame = 0
+        self.skipEmptyGestures()
+        self.framesWritten = 0
+        self.startTime = time.time()
+        self.endTime = None
+
+    # skipEmptyGestures()
+    #
+    # Moves on past gestures without frames, writing their delimiters.
+    def skipEmptyGestures(self):
+        while self.gesture < len(self.frameCounts) and self.gestureFrame == self.frameCounts[self.gesture]:
+            if self.csvFile is not None:
+                self.csvFile.write(self.delimiter + "\n")
+            self.gesture += 1
+            self.gestureFrame = 0
+
+    def writeFrame(self, row):
+        if self.gesture == len(self.frameCounts):
+            raise ValueError("More frames written than there are in the gestures")
+        if self.csvFile is not None:
+            self.csvFile.write(str(self.gestureFrame) + ", " + ", ".join([str(angle) for angle in row]) + "\n")
+        if self.binaryWriter is not None:
+            self.binaryWriter.writeFrame(row)
+
+        self.framesWritten += 1
+        self.gestureFrame += 1
+        self.skipEmptyGestures()
+
+    def close(self):
+        if self.csvFile is not None:
+            self.csvFile.close()
+        if self.binaryWriter is not None:
+            self.binaryWriter.close()
+        self.endTime = time.time()
+
+    def report(self):
+        seconds = max((self.endTime or time.time()) - self.startTime, 1e-6)
+        return ("Exported " + str(self.framesWritten) + " frames of " + str(len(self.frameCounts)) + " gestures in " +
+                str(round(seconds, 3)) + " seconds (" + str(int(self.framesWritten / seconds)) + " frames per second)")
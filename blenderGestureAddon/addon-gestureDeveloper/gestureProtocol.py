@@ -0,0 +1,434 @@
+# gestureProtocol.py
+#
+# Serial protocols for sending frames of servo angles to the Arduino, shared by
+# the Blender addon and pythonGesturer.
+#
+# These protocols are supported (chosen with "serialProtocol" in the YAML):
+#   - "echo": the original scheme, each angle is sent as a single byte (after
+#     an address byte of 181 + i when addressing) and the Arduino echoes every
+#     byte back before the next one is sent.
+#   - "packet": the whole frame is sent with a single write() as
+#         [FRAME_START] [servo count] [angle 0] ... [angle n-1] [checksum]
+#     and the Arduino answers once per frame with the checksum it computed.
+#     The checksum is (count + sum of angles) % CHECKSUM_MODULUS, so neither
+#     it nor an angle (0-180) can ever be mistaken for a start byte.
+#   - "windowed": packets additionally carry a sequence number,
+#         [SEQUENCED_FRAME_START] [sequence] [servo count] [angles...] [checksum]
+#     (with the sequence included in the checksum) and are acknowledged with
+#         [sequence] [checksum] [ACK_END]
+#     so up to windowSize frames can be in flight at once (see WindowedSender).
+#   - "playback": the gestures are compiled into the Arduino code, and the
+#     host only sends the number of the gesture to play, which the Arduino
+#     sends back once it finished playing it (see playGesture()).
+#
+# With "deltaUpdates" set, frames only carry the angles of servos that changed.
+# Packets then set DELTA_FLAG in the servo count and follow it with a mask of
+# the changed servos, seven per byte (bit i % 7 of byte i / 7), before the
+# changed angles. Echo frames skip the unchanged servos when addressing, and
+# start with the same mask bytes when switching.
+#
+# Before any frames are sent, the host can ask for a faster baud rate with
+# [BAUD_COMMAND] [index into baudRates], see negotiateBaudRate().
+
+import collections
+import struct
+import threading
+import time
+
+import serial
+import serial.threaded
+
+# Byte marking the start of a frame packet
+FRAME_START = 0xFF
+# Byte marking the start of a sequence numbered frame packet
+SEQUENCED_FRAME_START = 0xFE
+# Byte terminating the acknowledgement of a sequence numbered packet
+ACK_END = 0xFF
+# Checksums are kept below both start bytes
+CHECKSUM_MODULUS = 254
+# Sequence numbers wrap around at this value, keeping them clear of the start
+# bytes and well beyond any window size in use
+SEQUENCE_MODULUS = 128
+# Set in the servo count of packets carrying only the changed servos
+DELTA_FLAG = 0x80
+# Servos covered by each byte of a delta mask
+SERVOS_PER_MASK_BYTE = 7
+# Address bytes for the "addressing" motor identification are 181 + i
+ADDRESS_OFFSET = 181
+# Byte asking the Arduino to switch baud rate, above every address in use
+BAUD_COMMAND = 0xFD
+# Byte asking the Arduino to stop playing a gesture from flash
+STOP_COMMAND = 0xFC
+# Seconds the Arduino waits for a new baud rate to be confirmed before going
+# back to the one it started at
+BAUD_REVERT_TIME = 1.0
+
+# Protocol names as used in the YAML configs
+ECHO_PROTOCOL = "echo"
+PACKET_PROTOCOL = "packet"
+WINDOWED_PROTOCOL = "windowed"
+PLAYBACK_PROTOCOL = "playback"
+
+
+# deltaMask(angles, previousAngles)
+#
+# Which servos changed since previousAngles, every servo if there are none.
+def deltaMask(angles, previousAngles):
+    if previousAngles is None:
+        return [True] * len(angles)
+    return [angles[i] != previousAngles[i] for i in range(len(angles))]
+
+
+# encodeMask(changed)
+#
+# Packs a list of changed flags into mask bytes.
+def encodeMask(changed):
+    mask = bytearray((len(changed) + SERVOS_PER_MASK_BYTE - 1) // SERVOS_PER_MASK_BYTE)
+    for i in range(len(changed)):
+        if changed[i]:
+            mask[i // SERVOS_PER_MASK_BYTE] |= 1 << (i % SERVOS_PER_MASK_BYTE)
+    return mask
+
+
+# encodeFrameBody(angles, changed)
+#
+# Builds the servo count and angles of a packet. Given the changed flags, only
+# the changed angles are included, unless the mask would make the packet
+# larger than sending every angle.
+def encodeFrameBody(angles, changed=None):
+    if changed is not None:
+        changedAngles = [angles[i] for i in range(len(angles)) if changed[i]]
+        mask = encodeMask(changed)
+        if len(mask) + len(changedAngles) < len(angles):
+            return bytearray([DELTA_FLAG | len(angles)]) + mask + bytearray(changedAngles)
+    body = bytearray(len(angles) + 1)
+    body[0] = len(angles)
+    body[1:] = bytearray(angles)
+    return body
+
+
+# encodeFramePacket(angles, changed)
+#
+# Builds the packet for a single frame of servo angles.
+def encodeFramePacket(angles, changed=None):
+    body = encodeFrameBody(angles, changed)
+    packet = bytearray([FRAME_START]) + body
+    packet.append(sum(body) % CHECKSUM_MODULUS)
+    return packet
+
+
+# encodeSequencedPacket(sequence, angles, changed)
+#
+# Builds the sequence numbered packet for a single frame of servo angles.
+def encodeSequencedPacket(sequence, angles, changed=None):
+    body = encodeFrameBody(angles, changed)
+    packet = bytearray([SEQUENCED_FRAME_START, sequence]) + body
+    packet.append((sequence + sum(body)) % CHECKSUM_MODULUS)
+    return packet
+
+
+# sendEchoByte(serialPort, value)
+#
+# Sends a single byte and returns whether the Arduino echoed it back.
+def sendEchoByte(serialPort, value):
+    serialPort.write(struct.pack('B', value))
+    serialRead = serialPort.read()
+    return len(serialRead) == 1 and ord(serialRead) == value
+
+
+# sendEchoFrame(serialPort, angles, motorIdentification, changed)
+#
+# Sends a frame one byte at a time, waiting on the echo of every byte. Returns
+# False if the Arduino echoed back anything other than what was sent.
+def sendEchoFrame(serialPort, angles, motorIdentification, changed=None):
+    # Switching receivers built for delta updates expect every frame to
+    # start with the mask of changed servos
+    if changed is not None and motorIdentification != "addressing":
+        for maskByte in encodeMask(changed):
+            if not sendEchoByte(serialPort, maskByte):
+                return False
+
+    for i in range(len(angles)):
+        if changed is not None and not changed[i]:
+            continue
+        # If we are addressing motors, first send "i"
+        if motorIdentification == "addressing":
+            if not sendEchoByte(serialPort, ADDRESS_OFFSET + i):
+                return False
+        if not sendEchoByte(serialPort, angles[i]):
+            return False
+    return True
+
+
+# sendPacketFrame(serialPort, angles, changed)
+#
+# Sends a frame as a single packet and waits for its acknowledgement. Returns
+# False if the acknowledged checksum does not match the one sent.
+def sendPacketFrame(serialPort, angles, changed=None):
+    packet = encodeFramePacket(angles, changed)
+    serialPort.write(packet)
+    serialRead = serialPort.read()
+    return len(serialRead) == 1 and ord(serialRead) == packet[-1]
+
+
+# sendFrame(serialPort, angles, serialProtocol, motorIdentification, changed)
+#
+# Sends a frame with the configured protocol, returning whether the Arduino
+# confirmed receiving it. Windowed receivers also accept plain packets, so
+# callers without a WindowedSender fall back to one packet at a time. When
+# sending delta updates, changed holds the flags from deltaMask().
+def sendFrame(serialPort, angles, serialProtocol, motorIdentification, changed=None):
+    if serialProtocol in (PACKET_PROTOCOL, WINDOWED_PROTOCOL):
+        return sendPacketFrame(serialPort, angles, changed)
+    return sendEchoFrame(serialPort, angles, motorIdentification, changed)
+
+
+# playGesture(serialPort, gesture, duration)
+#
+# Asks the Arduino to play a gesture compiled into its flash and waits for it
+# to finish, for a second longer than the gesture's duration at most. Returns
+# whether the Arduino reported finishing that gesture.
+def playGesture(serialPort, gesture, duration):
+    initialTimeout = serialPort.timeout
+    serialPort.timeout = duration + 1.
+    try:
+        serialPort.write(bytearray([gesture]))
+        serialRead = serialPort.read()
+    finally:
+        serialPort.timeout = initialTimeout
+    return len(serialRead) == 1 and ord(serialRead) == gesture
+
+
+# serialPortFor(url, baudRate, timeout)
+#
+# A serial port, not yet opened, for the "serialPort" in the YAML configs.
+# Besides device names this takes pySerial URLs, e.g. socket://host:port, and
+# sim:// for an Arduino simulated in software (see gestureSimulator).
+def serialPortFor(url, baudRate=9600, timeout=None):
+    import gestureSimulator
+    gestureSimulator.register()
+    return serial.serial_for_url(url, baudRate, timeout=timeout, do_not_open=True)
+
+
+# negotiateBaudRate(serialPort, baudRates, replyTimeout)
+#
+# Steps the (open) serial port up to the fastest of baudRates that both sides
+# can communicate at. Each rate is requested at the current rate, then both
+# sides switch and the host repeats the request at the new rate, which the
+# Arduino only keeps if that confirmation arrives. Returns the baud rate in use
+# afterwards.
+def negotiateBaudRate(serialPort, baudRates, replyTimeout=0.5):
+    initialRate = serialPort.baudrate
+    initialTimeout = serialPort.timeout
+    serialPort.timeout = replyTimeout
+
+    try:
+        # Try the fastest rates first, the indices refer to the order the
+        # rates were generated into the Arduino code in
+        for rateIndex in sorted(range(len(baudRates)), key=lambda i: baudRates[i], reverse=True):
+            rate = baudRates[rateIndex]
+            if rate <= initialRate:
+                continue
+            request = bytearray([BAUD_COMMAND, rateIndex])
+
+            serialPort.reset_input_buffer()
+            serialPort.write(request)
+            if serialPort.read(2) != request:
+                continue
+
+            try:
+                serialPort.baudrate = rate
+            except (ValueError, serial.SerialException):
+                # This computer can't use the rate, so wait for the Arduino
+                # to go back to the initial rate
+                time.sleep(BAUD_REVERT_TIME)
+                continue
+
+            serialPort.reset_input_buffer()
+            serialPort.write(request)
+            if serialPort.read(2) == request:
+                return rate
+
+            serialPort.baudrate = initialRate
+            time.sleep(BAUD_REVERT_TIME)
+            serialPort.reset_input_buffer()
+    finally:
+        serialPort.timeout = initialTimeout
+
+    return serialPort.baudrate
+
+
+# AckPacketizer
+#
+# Splits the bytes read by the ReaderThread into acknowledgements and hands
+# them to the WindowedSender that owns the thread.
+class AckPacketizer(serial.threaded.Packetizer):
+    TERMINATOR = struct.pack('B', ACK_END)
+
+    def __init__(self, sender):
+        super(AckPacketizer, self).__init__()
+        self.sender = sender
+
+    def data_received(self, data):
+        # Several acknowledgements can arrive in a single read, so split them
+        # off one at a time
+        self.buffer.extend(data)
+        while self.TERMINATOR in self.buffer:
+            packet, self.buffer = self.buffer.split(self.TERMINATOR, 1)
+            self.handle_packet(packet)
+
+    def handle_packet(self, packet):
+        # Anything else is line noise, a timeout will recover the frame
+        if len(packet) == 2:
+            self.sender.acknowledge(packet[0], packet[1])
+
+
+# A frame awaiting acknowledgement, with the angles and changed flags it was
+# built from
+PendingFrame = collections.namedtuple("PendingFrame", ["packet", "angles", "changed"])
+
+
+# WindowedSender
+#
+# Sends sequence numbered packets with up to windowSize of them awaiting an
+# acknowledgement, which are matched on a serial.threaded.ReaderThread. Every
+# frame carries the angles of all servos, so only the newest frame matters:
+# an acknowledgement also settles any older frames still in flight, and a
+# frame that was corrupted or timed out is only sent again when nothing newer
+# has been sent since.
+#
+# With delta updates, a frame carries every servo that differs from the last
+# acknowledged frame or was changed by a frame still in flight, so it holds
+# whatever any lost frame before it would have set.
+class WindowedSender(object):
+
+    def __init__(self, serialPort, windowSize=4, ackTimeout=0.5, deltaUpdates=False):
+        self.serialPort = serialPort
+        # Keep the window well inside the sequence space, so a late
+        # acknowledgement can never be mistaken for a newer frame
+        self.windowSize = max(1, min(windowSize, SEQUENCE_MODULUS // 2))
+        self.ackTimeout = ackTimeout
+        self.deltaUpdates = deltaUpdates
+        # Angles of the last acknowledged frame, the base for delta updates
+        self.ackedAngles = None
+        # Frames awaiting acknowledgement by sequence number, oldest first
+        self.pending = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.nextSequence = 0
+        self.readerThread = None
+        # Counters for how often delivery had to recover
+        self.retransmits = 0
+        self.resyncs = 0
+
+    # start()
+    #
+    # Starts the reader thread on the (already open) serial port.
+    def start(self):
+        self.readerThread = serial.threaded.ReaderThread(self.serialPort, lambda: AckPacketizer(self))
+        self.readerThread.start()
+        self.readerThread.connect()
+
+    # stop()
+    #
+    # Waits for the frames in flight to be acknowledged, then stops the reader
+    # thread and closes the serial port. Returns whether every frame was
+    # acknowledged.
+    def stop(self):
+        flushed = self.flush()
+        self.readerThread.close()
+        return flushed
+
+    def report(self):
+        return ("Retransmitted " + str(self.retransmits) + " frames, resynced " + str(self.resyncs) +
+                " times, " + str(len(self.pending)) + " frames left unacknowledged")
+
+    # send(angles)
+    #
+    # Sends a frame, blocking only while the window is full. Returns False if
+    # the serial port was lost.
+    def send(self, angles):
+        with self.condition:
+            while len(self.pending) >= self.windowSize:
+                if not self.readerThread.alive:
+                    return False
+                if not self.condition.wait(self.ackTimeout):
+                    self.resync()
+
+            if not self.readerThread.alive:
+                return False
+            sequence = self.nextSequence
+            self.nextSequence = (self.nextSequence + 1) % SEQUENCE_MODULUS
+            changed = None
+            if self.deltaUpdates:
+                changed = deltaMask(angles, self.ackedAngles)
+                for frame in self.pending.values():
+                    changed = [changed[i] or frame.changed[i] for i in range(len(changed))]
+            packet = encodeSequencedPacket(sequence, angles, changed)
+            self.pending[sequence] = PendingFrame(packet, list(angles), changed)
+            self.readerThread.write(packet)
+        return True
+
+    # flush(maxResyncs)
+    #
+    # Waits until every frame in flight has been acknowledged, resyncing if
+    # the acknowledgements stop coming. Gives up after maxResyncs attempts and
+    # returns whether everything was acknowledged.
+    def flush(self, maxResyncs=3):
+        with self.condition:
+            attempts = 0
+            while len(self.pending) > 0 and self.readerThread.alive:
+                if not self.condition.wait(self.ackTimeout):
+                    if attempts == maxResyncs:
+                        return False
+                    self.resync()
+                    attempts += 1
+            return len(self.pending) == 0
+
+    # acknowledge(sequence, checksum)
+    #
+    # Called from the reader thread for every acknowledgement received.
+    def acknowledge(self, sequence, checksum):
+        with self.condition:
+            # Acknowledgements for frames already settled are stale
+            if sequence not in self.pending:
+                return
+            frame = self.pending[sequence]
+            if checksum != frame.packet[-1]:
+                self.retry(sequence)
+                return
+
+            # Settle this frame along with any older ones, which were
+            # superseded by it
+            while True:
+                oldestSequence, oldestFrame = self.pending.popitem(last=False)
+                if oldestSequence == sequence:
+                    break
+            self.ackedAngles = frame.angles
+            self.condition.notify_all()
+
+    # retry(sequence)
+    #
+    # Sends a corrupted frame again if it is still the newest one, and
+    # otherwise drops it since a newer frame is already on its way.
+    def retry(self, sequence):
+        newestSequence = next(reversed(self.pending))
+        if sequence == newestSequence:
+            self.readerThread.write(self.pending[sequence].packet)
+            self.retransmits += 1
+        else:
+            del self.pending[sequence]
+            self.condition.notify_all()
+
+    # resync()
+    #
+    # Recovers after acknowledgements stopped arriving (e.g. a lost byte left
+    # the Arduino waiting for the rest of a packet) by dropping every frame
+    # in flight but the newest and sending that one again.
+    def resync(self):
+        if len(self.pending) == 0:
+            return
+        newestSequence, newestFrame = self.pending.popitem()
+        self.pending.clear()
+        self.pending[newestSequence] = newestFrame
+        self.readerThread.write(newestFrame.packet)
+        self.resyncs += 1
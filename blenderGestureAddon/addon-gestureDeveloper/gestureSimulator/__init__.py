@@ -0,0 +1,37 @@
+# gestureSimulator
+#
+# A simulated Arduino for running the addon, pythonGesturer and benchmarks
+# without hardware. After register(), a serialPort of "sim://" in the YAML
+# configs opens a serial port with the firmware generateArduino.py would
+# generate on the other end (see protocol_sim.py for the options), and
+# simulatorServer.py serves the same firmware over TCP for socket:// ports,
+# e.g. for Blender and pythonGesturer running as separate programs.
+
+import serial
+
+from gestureSimulator.simulatedFirmware import (SimulatedFirmware, EchoFirmware, PacketFirmware, PlaybackFirmware,
+                                                firmwareFromConfigs)
+
+
+# register()
+#
+# Lets serial.serial_for_url() open sim:// URLs.
+def register():
+    if "gestureSimulator" not in serial.protocol_handler_packages:
+        serial.protocol_handler_packages.append("gestureSimulator")
+
+
+# openSimulator(firmware, baudrate, latency, timeout)
+#
+# An open serial port with the given simulated firmware on the other end.
+def openSimulator(firmware, baudrate=9600, latency=None, timeout=None):
+    from gestureSimulator import protocol_sim
+
+    port = protocol_sim.Serial(None, baudrate, timeout=timeout)
+    port.firmware = firmware
+    if latency is not None:
+        port.port = "sim://?latency=" + str(latency)
+    else:
+        port.port = "sim://"
+    port.open()
+    return port
@@ -0,0 +1,206 @@
+# protocol_sim.py
+#
+# pySerial handler for sim:// URLs, a serial port with a simulated Arduino on
+# the other end (see simulatedFirmware.py). Built on the loop:// handler, with
+# the bytes timed as they would be on a real line: each byte takes 10 bits at
+# the baud rate to cross in either direction, and replies are delayed by the
+# latency of the USB serial adapter. Bytes sent at a baud rate the Arduino is
+# not listening at are lost, so baud rate negotiation behaves as it would.
+#
+# URL format: sim://[?option=value[&option=value...]]
+# options:
+#   - configs: YAML configs file to simulate the firmware generated for
+#     (defaults to two servos with the echo protocol and switching)
+#   - latency: seconds added to every reply (defaults to 0.001)
+#   - any other option overrides the config of the same name, e.g.
+#     sim://?configs=gesturerConfigs.yaml&serialProtocol=windowed
+
+import collections
+import threading
+import time
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+import yaml
+
+from serial.serialutil import SerialException, to_bytes, iterbytes, portNotOpenError
+from serial.urlhandler import protocol_loop
+
+import gesturerConfigs
+
+from gestureSimulator import simulatedFirmware
+
+# Seconds of latency added to each reply by default, typical of USB serial
+# adapters
+DEFAULT_LATENCY = 0.001
+# Configs of the firmware simulated when no configs file is given
+DEFAULT_CONFIGS = {"numObjects": 2, "serialProtocol": "echo", "motorIdentification": "switching"}
+
+
+class Serial(protocol_loop.Serial):
+
+    def __init__(self, *args, **kwargs):
+        # Set by from_url(), or beforehand to simulate a particular firmware
+        self.firmware = None
+        self.latency = DEFAULT_LATENCY
+        self.condition = threading.Condition()
+        # Bytes on their way to the host, as (time they arrive, byte)
+        self.incoming = collections.deque()
+        # Times the line to the Arduino and the line back are next free
+        self.sendFree = 0.
+        self.replyFree = 0.
+        self.readCancelled = False
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        # Opens the port when given one
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        super(Serial, self).open()
+        self.sendFree = self.replyFree = time.monotonic()
+
+    def close(self):
+        with self.condition:
+            self.condition.notify_all()
+        super(Serial, self).close()
+
+    def from_url(self, url):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "sim":
+            raise SerialException('expected a string in the form "sim://[?configs=<file>][&latency=<seconds>]": '
+                                  'not starting with sim:// (%r)' % (parts.scheme,))
+        options = dict((option, values[0]) for option, values in urlparse.parse_qs(parts.query, True).items())
+        if "latency" in options:
+            self.latency = float(options.pop("latency"))
+        if self.firmware is not None:
+            return
+
+        if "configs" in options:
+            configs = dict(gesturerConfigs.loadConfigs(options.pop("configs")))
+        else:
+            configs = dict(DEFAULT_CONFIGS)
+        # Overrides are read as YAML, so numbers and booleans come out as such
+        for option, value in options.items():
+            configs[option] = yaml.safe_load(value)
+        self.firmware = simulatedFirmware.firmwareFromConfigs(configs)
+
+    def byteTime(self, baudRate):
+        # A start bit, eight data bits and a stop bit
+        return 10. / baudRate
+
+    # Queues the bytes the firmware sent on its own by now
+    def pollFirmware(self, now):
+        for sendTime, data in self.firmware.poll(now):
+            self.queueReply(sendTime, data, self.firmware.baudRate)
+
+    # Puts bytes the Arduino sent at sendTime on the line back to the host,
+    # where they only make sense if the host is at the rate they were sent at
+    def queueReply(self, sendTime, data, baudRate):
+        if baudRate != self._baudrate:
+            return
+        byteTime = self.byteTime(baudRate)
+        arrival = max(self.replyFree, sendTime + self.latency)
+        for value in iterbytes(data):
+            arrival += byteTime
+            self.incoming.append((arrival, value))
+        self.replyFree = arrival
+        self.condition.notify_all()
+
+    #  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise portNotOpenError
+        with self.condition:
+            now = time.monotonic()
+            self.pollFirmware(now)
+            waiting = 0
+            for arrival, value in self.incoming:
+                if arrival > now:
+                    break
+                waiting += 1
+            return waiting
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise portNotOpenError
+        deadline = None
+        if self._timeout is not None:
+            deadline = time.monotonic() + self._timeout
+        data = bytearray()
+        with self.condition:
+            self.readCancelled = False
+            while len(data) < size and self.is_open and not self.readCancelled:
+                now = time.monotonic()
+                self.pollFirmware(now)
+                while len(data) < size and len(self.incoming) > 0 and self.incoming[0][0] <= now:
+                    data += self.incoming.popleft()[1]
+                if len(data) == size or (deadline is not None and now >= deadline):
+                    break
+
+                # Sleep until the next byte arrives, the firmware has
+                # something to send, or the read times out, whichever is first
+                wakeTimes = [deadline, self.firmware.nextEvent()]
+                if len(self.incoming) > 0:
+                    wakeTimes.append(self.incoming[0][0])
+                wakeTimes = [wakeTime for wakeTime in wakeTimes if wakeTime is not None]
+                if len(wakeTimes) > 0:
+                    self.condition.wait(max(0., min(wakeTimes) - now))
+                else:
+                    self.condition.wait()
+        self.bytesRead += len(data)
+        return bytes(data)
+
+    def cancel_read(self):
+        with self.condition:
+            self.readCancelled = True
+            self.condition.notify_all()
+
+    # write(data)
+    #
+    # Returns straight away like a buffered port, the bytes are handed to the
+    # firmware at the times they would arrive.
+    def write(self, data):
+        if not self.is_open:
+            raise portNotOpenError
+        data = to_bytes(data)
+        with self.condition:
+            now = time.monotonic()
+            self.pollFirmware(now)
+            byteTime = self.byteTime(self._baudrate)
+            arrival = max(self.sendFree, now)
+            for value in iterbytes(data):
+                arrival += byteTime
+                baudRate = self.firmware.listeningRate(arrival)
+                if baudRate != self._baudrate:
+                    continue
+                # Replies go out at the rate the byte was received at, a new
+                # rate is only switched to after the request is echoed
+                reply = self.firmware.receive(ord(value), arrival)
+                if len(reply) > 0:
+                    self.queueReply(arrival, reply, baudRate)
+            self.sendFree = arrival
+            self.bytesWritten += len(data)
+        return len(data)
+
+    def flush(self):
+        # Wait for everything written to be sent
+        delay = self.sendFree - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise portNotOpenError
+        with self.condition:
+            now = time.monotonic()
+            self.pollFirmware(now)
+            while len(self.incoming) > 0 and self.incoming[0][0] <= now:
+                self.incoming.popleft()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise portNotOpenError
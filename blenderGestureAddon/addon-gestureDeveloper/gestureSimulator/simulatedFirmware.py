@@ -0,0 +1,314 @@
+# simulatedFirmware.py
+#
+# Software stand-ins for the sketches generateArduino.py generates, which
+# take the bytes the host sends one at a time and return the bytes the
+# Arduino would send back. They keep the angles the servos were last written
+# to and count servo writes and frames, but know nothing about time beyond
+# the times they are handed, see protocol_sim.py for the serial line.
+
+import os
+
+import gestureBinary
+import gestureProtocol
+
+# Address bytes above every angle, as in motors_template.ino
+MAX_ANGLE = 180
+
+
+# SimulatedFirmware
+#
+# Handles what every sketch shares, the baud rate negotiation, and hands all
+# other bytes to receiveData(). baudRate is the rate the Arduino is listening
+# at, which changes when the host asks for a faster one.
+class SimulatedFirmware(object):
+
+    def __init__(self, numServos, servoLimits=None, baudRate=9600, baudRates=None):
+        self.numServos = numServos
+        self.servoLimits = gestureBinary.normalizeLimits(numServos, servoLimits)
+        self.initialBaudRate = baudRate
+        self.baudRate = baudRate
+        self.baudRates = list(baudRates) if baudRates else [baudRate]
+        self.angles = [0] * numServos
+        self.servoWrites = 0
+        self.frames = 0
+        # Baud rate negotiation: waiting for the index following the baud
+        # command, or for the host to confirm the rate it asked for
+        self.awaitingRateIndex = False
+        self.confirmingRate = None
+        self.confirmDeadline = 0.
+        self.confirmBytes = bytearray()
+
+    # receive(value, now)
+    #
+    # The bytes sent back for a byte received at time now.
+    def receive(self, value, now):
+        if self.confirmingRate is not None:
+            return self.confirmBaudRate(value, now)
+        if self.awaitingRateIndex:
+            self.awaitingRateIndex = False
+            return self.switchBaudRate(value, now)
+        if value == gestureProtocol.BAUD_COMMAND and self.betweenFrames():
+            self.awaitingRateIndex = True
+            return bytearray()
+        return self.receiveData(value, now)
+
+    def switchBaudRate(self, rateIndex, now):
+        if rateIndex >= len(self.baudRates):
+            return bytearray()
+        self.baudRate = self.baudRates[rateIndex]
+        self.confirmingRate = rateIndex
+        self.confirmDeadline = now + gestureProtocol.BAUD_REVERT_TIME
+        self.confirmBytes = bytearray()
+        return bytearray([gestureProtocol.BAUD_COMMAND, rateIndex])
+
+    # The new rate is kept only if the next two bytes repeat the request
+    # within the revert time
+    def confirmBaudRate(self, value, now):
+        if now > self.confirmDeadline:
+            self.revertBaudRate()
+            return self.receive(value, now)
+        self.confirmBytes.append(value)
+        if len(self.confirmBytes) < 2:
+            return bytearray()
+        request = bytearray([gestureProtocol.BAUD_COMMAND, self.confirmingRate])
+        if self.confirmBytes == request:
+            self.confirmingRate = None
+            return request
+        self.revertBaudRate()
+        return bytearray()
+
+    def revertBaudRate(self):
+        self.baudRate = self.initialBaudRate
+        self.confirmingRate = None
+
+    # listeningRate(now)
+    #
+    # The baud rate bytes arriving at time now are read at, reverting first
+    # if the host never confirmed a new rate.
+    def listeningRate(self, now):
+        if self.confirmingRate is not None and now > self.confirmDeadline:
+            self.revertBaudRate()
+        return self.baudRate
+
+    def writeServo(self, servo, angle):
+        self.angles[servo] = angle
+        self.servoWrites += 1
+
+    def betweenFrames(self):
+        return True
+
+    def receiveData(self, value, now):
+        return bytearray()
+
+    # poll(now)
+    #
+    # Bytes the Arduino sends on its own by time now, as a list of (time,
+    # bytes), and nextEvent() the time the next of them is due.
+    def poll(self, now):
+        return []
+
+    def nextEvent(self):
+        return None
+
+
+# EchoFirmware
+#
+# motors_template.ino (with switching or addressing), and
+# motors_delta_template.ino for switching with delta updates. Every byte is
+# echoed back, angles above 180 are clamped when switching and are the
+# address (181 + i) of the next servo when addressing.
+class EchoFirmware(SimulatedFirmware):
+
+    def __init__(self, numServos, servoLimits=None, baudRate=9600, baudRates=None,
+                 motorIdentification="switching", deltaUpdates=False):
+        super(EchoFirmware, self).__init__(numServos, servoLimits, baudRate, baudRates)
+        self.addressing = motorIdentification == "addressing"
+        # Only switching receivers take a mask of the changed servos
+        self.deltaUpdates = deltaUpdates and not self.addressing
+        self.maskBytes = (numServos + gestureProtocol.SERVOS_PER_MASK_BYTE - 1) // gestureProtocol.SERVOS_PER_MASK_BYTE
+        self.mask = bytearray(self.maskBytes)
+        self.maskIndex = 0
+        self.currentServo = 0
+
+    def nextServo(self, servo):
+        while servo < self.numServos and not (self.mask[servo // 7] >> (servo % 7)) & 1:
+            servo += 1
+        return servo
+
+    def receiveData(self, value, now):
+        if self.deltaUpdates:
+            self.receiveDelta(value)
+            return bytearray([value])
+
+        data = value
+        if data > MAX_ANGLE:
+            if self.addressing:
+                self.currentServo = max(0, data - (MAX_ANGLE + 1))
+                return bytearray([value])
+            data = MAX_ANGLE
+        if self.currentServo < self.numServos:
+            self.writeServo(self.currentServo, data)
+        if not self.addressing:
+            self.currentServo += 1
+            if self.currentServo == self.numServos:
+                self.currentServo = 0
+                self.frames += 1
+        return bytearray([value])
+
+    def receiveDelta(self, value):
+        if self.maskIndex < self.maskBytes:
+            self.mask[self.maskIndex] = value
+            self.maskIndex += 1
+            if self.maskIndex == self.maskBytes:
+                self.currentServo = self.nextServo(0)
+        else:
+            if self.currentServo < self.numServos:
+                self.writeServo(self.currentServo, min(value, MAX_ANGLE))
+            self.currentServo = self.nextServo(self.currentServo + 1)
+        if self.maskIndex == self.maskBytes and self.currentServo == self.numServos:
+            self.maskIndex = 0
+            self.frames += 1
+
+
+# PacketFirmware
+#
+# motors_packet_template.ino and motors_table_template.ino, for the packet and
+# windowed protocols. Frames are applied whole once their checksum matches,
+# clamped to the servo limits by the table layout.
+class PacketFirmware(SimulatedFirmware):
+
+    def __init__(self, numServos, servoLimits=None, baudRate=9600, baudRates=None, clampToLimits=True):
+        super(PacketFirmware, self).__init__(numServos, servoLimits, baudRate, baudRates)
+        self.clampToLimits = clampToLimits
+        self.maskBytes = (numServos + gestureProtocol.SERVOS_PER_MASK_BYTE - 1) // gestureProtocol.SERVOS_PER_MASK_BYTE
+        self.packet = None
+        self.corruptPackets = 0
+
+    def betweenFrames(self):
+        return self.packet is None
+
+    def receiveData(self, value, now):
+        # A start byte always begins a new packet
+        if value in (gestureProtocol.FRAME_START, gestureProtocol.SEQUENCED_FRAME_START):
+            self.packet = bytearray([value])
+            return bytearray()
+        if self.packet is None:
+            return bytearray()
+
+        self.packet.append(value)
+        length = self.packetLength()
+        if length < 0:
+            self.packet = None
+        elif length > 0 and len(self.packet) == length:
+            packet = self.packet
+            self.packet = None
+            return self.applyPacket(packet)
+        return bytearray()
+
+    # Length of the packet being received, 0 if more bytes are needed to tell,
+    # or -1 if it cannot be a packet for these servos
+    def packetLength(self):
+        header = 3 if self.packet[0] == gestureProtocol.SEQUENCED_FRAME_START else 2
+        if len(self.packet) < header:
+            return 0
+        count = self.packet[header - 1]
+        if count & ~gestureProtocol.DELTA_FLAG != self.numServos:
+            return -1
+        if not count & gestureProtocol.DELTA_FLAG:
+            return header + self.numServos + 1
+        if len(self.packet) < header + self.maskBytes:
+            return 0
+        mask = self.packet[header:header + self.maskBytes]
+        changed = [(mask[i // 7] >> (i % 7)) & 1 for i in range(self.numServos)]
+        return header + self.maskBytes + sum(changed) + 1
+
+    def applyPacket(self, packet):
+        sequenced = packet[0] == gestureProtocol.SEQUENCED_FRAME_START
+        packetSum = sum(packet[1:-1]) % gestureProtocol.CHECKSUM_MODULUS
+        if sequenced:
+            reply = bytearray([packet[1], packetSum, gestureProtocol.ACK_END])
+        else:
+            reply = bytearray([packetSum])
+        if packetSum != packet[-1]:
+            self.corruptPackets += 1
+            return reply
+
+        position = 2 if sequenced else 1
+        delta = packet[position] & gestureProtocol.DELTA_FLAG
+        position += 1
+        maskStart = position
+        if delta:
+            position += self.maskBytes
+        for i in range(self.numServos):
+            if not delta or (packet[maskStart + i // 7] >> (i % 7)) & 1:
+                angle = min(packet[position], MAX_ANGLE)
+                if self.clampToLimits:
+                    angle = min(max(angle, self.servoLimits[i][0]), self.servoLimits[i][1])
+                self.angles[i] = angle
+                position += 1
+        self.servoWrites += self.numServos
+        self.frames += 1
+        return reply
+
+
+# PlaybackFirmware
+#
+# motors_playback_template.ino, playing gestures (lists of frames) by number
+# at frameRate and sending the number back once the last frame is written.
+class PlaybackFirmware(SimulatedFirmware):
+
+    def __init__(self, numServos, servoLimits=None, baudRate=9600, baudRates=None, gestures=None, frameRate=24):
+        super(PlaybackFirmware, self).__init__(numServos, servoLimits, baudRate, baudRates)
+        self.gestures = [[gestureBinary.clampRow(row, self.servoLimits) for row in gesture] for gesture in (gestures or [])]
+        self.framePeriod = 1. / frameRate
+        self.playing = None
+        self.finishTime = 0.
+
+    def receiveData(self, value, now):
+        if value == gestureProtocol.STOP_COMMAND:
+            self.playing = None
+        elif value < len(self.gestures):
+            self.playing = value
+            # The first frame is written straight away
+            self.finishTime = now + max(0, len(self.gestures[value]) - 1) * self.framePeriod
+        return bytearray()
+
+    def poll(self, now):
+        if self.playing is None or now < self.finishTime:
+            return []
+        gesture = self.gestures[self.playing]
+        if len(gesture) > 0:
+            self.angles = list(gesture[-1])
+        self.servoWrites += len(gesture) * self.numServos
+        self.frames += len(gesture)
+        finished = [(self.finishTime, bytearray([self.playing]))]
+        self.playing = None
+        return finished
+
+    def nextEvent(self):
+        return self.finishTime if self.playing is not None else None
+
+
+# firmwareFromConfigs(configs)
+#
+# The simulated firmware generateArduino.py would generate for the configs.
+def firmwareFromConfigs(configs):
+    numServos = configs["numObjects"]
+    servoLimits = configs.get("servoLimits")
+    baudRate = configs.get("baudRate", 9600)
+    baudRates = configs.get("baudRates", [])
+    serialProtocol = configs.get("serialProtocol", gestureProtocol.ECHO_PROTOCOL)
+
+    if serialProtocol in (gestureProtocol.PACKET_PROTOCOL, gestureProtocol.WINDOWED_PROTOCOL):
+        return PacketFirmware(numServos, servoLimits, baudRate, baudRates,
+                              configs.get("firmwareLayout", "unrolled") == "table")
+    if serialProtocol == gestureProtocol.PLAYBACK_PROTOCOL:
+        gestures = []
+        csvOutputName = configs.get("csvOutputName", "animationOutput.csv")
+        if os.path.exists(csvOutputName):
+            gestures = gestureBinary.readCsvGestures(csvOutputName, configs["numGestures"], numServos,
+                                                     configs.get("gestureDelimiter", "*"))
+            gestures = gestureBinary.playbackGestures(gestures, configs.get("playbackReversedGestures", []))
+        return PlaybackFirmware(numServos, servoLimits, baudRate, baudRates, gestures, configs.get("frameRate", 24))
+    return EchoFirmware(numServos, servoLimits, baudRate, baudRates, configs.get("motorIdentification", "switching"),
+                        configs.get("deltaUpdates", False))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# simulatorServer.py
+#
+# Serves a simulated Arduino over TCP, so the addon and pythonGesturer can
+# connect to it with a serialPort of "socket://localhost:<port>". Each
+# connection gets a fresh firmware, simulated from the configs in the current
+# directory, with replies paced at the firmware's baud rate plus latency.
+#
+# Usage: python simulatorServer.py [port] [latency in seconds]
+
+import heapq
+import os
+import select
+import socket
+import sys
+import time
+
+# The simulator package and the modules it shares with the addon live one
+# folder up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gesturerConfigs
+from gestureSimulator import protocol_sim, simulatedFirmware
+
+DEFAULT_PORT = 7777
+
+
+# serveConnection(connection, firmware, latency)
+#
+# Feeds the bytes received on the connection to the firmware until the host
+# disconnects, sending each reply once it would have crossed the line.
+def serveConnection(connection, firmware, latency):
+    # Replies waiting to be sent, as (time due, order, bytes)
+    replies = []
+    order = 0
+    sendFree = replyFree = time.monotonic()
+    while True:
+        for sendTime, data in firmware.poll(time.monotonic()):
+            replyFree = max(replyFree, sendTime + latency) + len(data) * 10. / firmware.baudRate
+            heapq.heappush(replies, (replyFree, order, data))
+            order += 1
+
+        now = time.monotonic()
+        while len(replies) > 0 and replies[0][0] <= now:
+            connection.sendall(bytes(heapq.heappop(replies)[2]))
+
+        wakeTimes = [reply[0] for reply in replies[:1]]
+        if firmware.nextEvent() is not None:
+            wakeTimes.append(firmware.nextEvent())
+        timeout = max(0., min(wakeTimes) - now) if len(wakeTimes) > 0 else None
+        readable, writable, failed = select.select([connection], [], [], timeout)
+        if len(readable) == 0:
+            continue
+
+        received = connection.recv(4096)
+        if len(received) == 0:
+            return
+        now = time.monotonic()
+        arrival = max(sendFree, now)
+        for value in bytearray(received):
+            arrival += 10. / firmware.listeningRate(arrival)
+            reply = firmware.receive(value, arrival)
+            if len(reply) > 0:
+                replyFree = max(replyFree, arrival + latency) + len(reply) * 10. / firmware.baudRate
+                heapq.heappush(replies, (replyFree, order, reply))
+                order += 1
+        sendFree = arrival
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else protocol_sim.DEFAULT_LATENCY
+    configs = gesturerConfigs.loadConfigs("gesturerConfigs.yaml")
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("localhost", port))
+    server.listen(1)
+    print("Simulating the Arduino for gesturerConfigs.yaml on socket://localhost:" + str(port))
+
+    while True:
+        connection, address = server.accept()
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        firmware = simulatedFirmware.firmwareFromConfigs(configs)
+        print("Connected, simulating " + type(firmware).__name__)
+        try:
+            serveConnection(connection, firmware, latency)
+        except socket.error as error:
+            print("Connection lost: " + str(error))
+        connection.close()
+        print("Disconnected after " + str(firmware.frames) + " frames")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# gesturerConfigs.py
+#
+# Loads gesturerConfigs.yaml for the addon, pythonGesturer and the scripts
+# around them. The YAML is parsed with the C loader when PyYAML was built with
+# it, checked once, and the result is cached in a pickle next to the YAML file
+# (".gesturerConfigs.yaml.cache"), so later loads skip parsing until the YAML
+# changes. Works with either version of Python.
+
+import hashlib
+import os
+import pickle
+
+import yaml
+
+# Bumped whenever validateConfigs() changes what it produces, so old caches
+# are not used
+CACHE_VERSION = 2
+
+# Configs with an entry per servo
+SERVO_LISTS = ["objectNames", "objectAxes", "objectMultipliers", "objectOffsets", "servoPins", "servoLimits"]
+# Configs with an entry per servo that hold whole numbers
+INTEGER_LISTS = ["objectAxes", "objectMultipliers", "objectOffsets", "servoPins"]
+
+# Fastest loader available that only builds plain YAML types
+if hasattr(yaml, "CSafeLoader"):
+    Loader = yaml.CSafeLoader
+else:
+    Loader = yaml.SafeLoader
+
+
+# ConfigError
+#
+# Raised when the configs are missing values or inconsistent.
+class ConfigError(ValueError):
+    pass
+
+
+# validateConfigs(configs, fileName)
+#
+# Checks the servo and gesture configs against numObjects and numGestures and
+# converts the numbers given as strings (e.g. '1' for a multiplier) to ints.
+def validateConfigs(configs, fileName="gesturerConfigs.yaml"):
+    if not isinstance(configs, dict):
+        raise ConfigError(fileName + " does not hold a mapping of configs")
+    for key in ["numObjects", "numGestures"]:
+        if not isinstance(configs.get(key), int):
+            raise ConfigError(fileName + ": " + key + " must be a whole number")
+
+    numObjects = configs["numObjects"]
+    for key in SERVO_LISTS:
+        if key not in configs:
+            continue
+        if not isinstance(configs[key], list) or len(configs[key]) != numObjects:
+            raise ConfigError(fileName + ": " + key + " must have an entry for each of the " + str(numObjects) + " servos")
+    for key in INTEGER_LISTS:
+        if key not in configs:
+            continue
+        try:
+            configs[key] = [int(value) for value in configs[key]]
+        except (TypeError, ValueError):
+            raise ConfigError(fileName + ": " + key + " must only hold whole numbers")
+
+    numGestures = configs["numGestures"]
+    gestureFrames = configs.get("gestureFrames", [])
+    if not isinstance(gestureFrames, list) or len(gestureFrames) < numGestures:
+        raise ConfigError(fileName + ": gestureFrames must have a start and end frame for each of the " +
+                          str(numGestures) + " gestures")
+    for gesture in range(numGestures):
+        frames = gestureFrames[gesture]
+        if not isinstance(frames, list) or len(frames) != 2:
+            raise ConfigError(fileName + ": gestureFrames of gesture " + str(gesture) + " must be [start, end]")
+        try:
+            gestureFrames[gesture] = [int(frame) for frame in frames]
+        except (TypeError, ValueError):
+            raise ConfigError(fileName + ": gestureFrames of gesture " + str(gesture) + " must be whole numbers")
+        if gestureFrames[gesture][0] > gestureFrames[gesture][1]:
+            raise ConfigError(fileName + ": gestureFrames of gesture " + str(gesture) + " must start before it ends")
+    return configs
+
+
+# parseConfigs(text, fileName)
+#
+# Parses and validates the text of a configs file.
+def parseConfigs(text, fileName="gesturerConfigs.yaml"):
+    return validateConfigs(yaml.load(text, Loader=Loader), fileName)
+
+
+def cacheFileName(fileName):
+    directory, baseName = os.path.split(os.path.abspath(fileName))
+    return os.path.join(directory, "." + baseName + ".cache")
+
+
+# loadConfigs(fileName)
+#
+# Returns the configs in the file as a dict, from the cache if the file has
+# not changed since it was cached.
+def loadConfigs(fileName="gesturerConfigs.yaml"):
+    configsFile = open(fileName, "rb")
+    text = configsFile.read()
+    configsFile.close()
+    digest = hashlib.sha1(text).hexdigest()
+
+    # Any cache that is unreadable or out of date is simply rebuilt
+    cacheName = cacheFileName(fileName)
+    try:
+        cacheFile = open(cacheName, "rb")
+        cached = pickle.load(cacheFile)
+        cacheFile.close()
+        if cached["version"] == CACHE_VERSION and cached["digest"] == digest:
+            return cached["configs"]
+    except Exception:
+        pass
+
+    configs = parseConfigs(text, fileName)
+    try:
+        cacheFile = open(cacheName, "wb")
+        pickle.dump({"version": CACHE_VERSION, "digest": digest, "configs": configs}, cacheFile, 2)
+        cacheFile.close()
+    except (IOError, OSError):
+        # Nowhere to cache, e.g. a read only folder, so parse every time
+        pass
+    return configs
@@ -0,0 +1,90 @@
+# previewStreamer.py
+#
+# Streams the live preview of the Blender addon to the robot from a thread of
+# its own, so Blender's scene handler never waits on the serial port. The
+# handler publishes the newest servo angles into a single slot mailbox, and
+# the sender thread takes whatever is in the slot at a fixed rate, so angles
+# published in between are coalesced and the robot is never more than a frame
+# behind the scene.
+
+import threading
+import time
+
+
+# PreviewStreamer
+#
+# sendAngles(angles) is called on the sender thread for each frame sent, and
+# returns whether the frame was delivered. After a failed send the streamer
+# stops and failed is set, for the main thread to deal with. sendAngles should
+# give up on an Arduino that does not answer (e.g. with a serial timeout), as
+# stop() can only wait for the frame being sent to finish.
+class PreviewStreamer(object):
+
+    def __init__(self, sendAngles, frameRate=30):
+        self.sendAngles = sendAngles
+        self.framePeriod = 1. / frameRate
+        # The mailbox, replaced whole by publish() so the sender always reads
+        # a complete frame without locking
+        self.latest = None
+        self.published = threading.Event()
+        self.running = False
+        self.failed = False
+        self.thread = None
+        self.sentFrames = 0
+        self.publishedFrames = 0
+
+    def start(self):
+        self.latest = None
+        self.failed = False
+        self.running = True
+        self.thread = threading.Thread(target=self.sendLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # publish(angles)
+    #
+    # Puts the newest angles in the mailbox, replacing any not yet sent.
+    # Never blocks.
+    def publish(self, angles):
+        self.latest = list(angles)
+        self.publishedFrames += 1
+        self.published.set()
+
+    def sendLoop(self):
+        deadline = time.monotonic()
+        while self.running:
+            # Sleep until something is published, checking now and then
+            # whether we were stopped
+            if not self.published.wait(0.1):
+                continue
+            self.published.clear()
+            angles = self.latest
+
+            if not self.sendAngles(angles):
+                self.failed = True
+                self.running = False
+                break
+            self.sentFrames += 1
+
+            # Send at most one frame per period, anything published meanwhile
+            # is coalesced into the next frame
+            deadline = max(deadline + self.framePeriod, time.monotonic())
+            time.sleep(max(0., deadline - time.monotonic()))
+
+    # stop(timeout)
+    #
+    # Stops sending, waiting up to timeout seconds (forever when None) for the
+    # frame being sent. Returns False if the sender thread is still stuck in
+    # sendAngles, in which case it is left to finish on its own.
+    def stop(self, timeout=None):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                return False
+            self.thread = None
+        return True
+
+    def report(self):
+        return ("Sent " + str(self.sentFrames) + " of " + str(self.publishedFrames) +
+                " preview frames, the rest were coalesced")
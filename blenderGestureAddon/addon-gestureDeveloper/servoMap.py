@@ -0,0 +1,74 @@
+# servoMap.py
+#
+# How the rotation of each Blender object maps to the angle of its servo,
+# compiled once from the configs and shared by the addon, pythonGesturer and
+# generateArduino.py. A servo's angle is its offset plus its multiplier times
+# the object's rotation about its axis in whole degrees, clamped to the
+# servo's limits. NumPy is used to map every servo (and every frame) at once
+# when it is available, generateArduino.py works without it.
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import gestureBinary
+
+
+# ServoMap
+#
+# Per servo names, axes, multipliers, offsets, pins and [lower, upper]
+# limits, as plain lists and (with NumPy) as arrays for the vectorized maps.
+class ServoMap(object):
+
+    def __init__(self, names, axes, multipliers, offsets, pins=None, limits=None):
+        self.numServos = len(names)
+        self.names = list(names)
+        self.axes = [int(axis) for axis in axes]
+        self.multipliers = [int(multiplier) for multiplier in multipliers]
+        self.offsets = [int(offset) for offset in offsets]
+        self.pins = [int(pin) for pin in pins] if pins is not None else []
+        self.limits = gestureBinary.normalizeLimits(self.numServos, limits)
+        self.lower = [lower for lower, upper in self.limits]
+        self.upper = [upper for lower, upper in self.limits]
+
+        if numpy is not None:
+            self.multiplierArray = numpy.array(self.multipliers, dtype=numpy.int32)
+            self.offsetArray = numpy.array(self.offsets, dtype=numpy.int32)
+            self.lowerArray = numpy.array(self.lower, dtype=numpy.int32)
+            self.upperArray = numpy.array(self.upper, dtype=numpy.int32)
+
+    # fromConfigs(configs)
+    #
+    # The servo map described by the (validated) YAML configs.
+    @classmethod
+    def fromConfigs(cls, configs):
+        return cls(configs["objectNames"], configs["objectAxes"], configs["objectMultipliers"],
+                   configs["objectOffsets"], configs.get("servoPins"), configs.get("servoLimits"))
+
+    # clamp(angles)
+    #
+    # Angles of every servo (the last axis of a NumPy array, or a list for a
+    # single frame) clamped to the servo limits.
+    def clamp(self, angles):
+        if numpy is not None:
+            return numpy.clip(angles, self.lowerArray, self.upperArray)
+        return [min(max(int(angles[i]), self.lower[i]), self.upper[i]) for i in range(self.numServos)]
+
+    # anglesFromRotations(rotations)
+    #
+    # Servo angles for object rotations in radians, either one frame (a list
+    # with a rotation per servo) or a frames x servos array. Frames are
+    # returned the same way they were given.
+    def anglesFromRotations(self, rotations):
+        if numpy is None:
+            angles = [self.offsets[i] + self.multipliers[i] * int(math.degrees(rotations[i])) for i in range(self.numServos)]
+            return self.clamp(angles)
+
+        movement = numpy.trunc(numpy.degrees(numpy.asarray(rotations, dtype=numpy.float64))).astype(numpy.int32)
+        angles = self.clamp(self.offsetArray + self.multiplierArray * movement)
+        if isinstance(rotations, list):
+            return angles.tolist()
+        return angles
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# convertGestures.py
+#
+# Converts the CSV gesture output of the addon into the binary gesture library
+# format (see addon-gestureDeveloper/gestureBinary.py) using YAML configs.
+
+# Import standard libraries
+import argparse
+import os
+import sys
+import inspect
+import time
+
+# Get the path to the current directory so we can add 3rd-party libraries
+currentDirectory = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+# If we are using Python 3, grab libraries from the Blender addon
+if sys.version_info >= (3, 0):
+    addonLibs = currentDirectory + "/addon-gestureDeveloper/"
+# Otherwise, we are using Python 2, so grab the Python 2 libraries
+else:
+    addonLibs = currentDirectory + "/python2Libs/"
+# Make 3rd party libraries available for import
+sys.path.append(addonLibs)
+# The gesture library format is shared with the addon, and works with either
+# version of Python
+if sys.version_info < (3, 0):
+    sys.path.append(currentDirectory + "/addon-gestureDeveloper/")
+import gestureBinary
+import gesturerConfigs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV gesture output into a binary gesture library.")
+    parser.add_argument("input", nargs="?", help="CSV file to convert (default: csvOutputName from the configs)")
+    parser.add_argument("output", nargs="?", help="Binary file to write (default: binaryOutputName from the configs)")
+    parser.add_argument("--configs", default="gesturerConfigs.yaml", help="YAML configs to read")
+    args = parser.parse_args()
+
+    yamlConfigs = gesturerConfigs.loadConfigs(args.configs)
+
+    numServos = yamlConfigs["numObjects"]
+    numGestures = yamlConfigs["numGestures"]
+    inputName = args.input or yamlConfigs["csvOutputName"]
+    outputName = args.output or yamlConfigs.get("binaryOutputName", os.path.splitext(inputName)[0] + ".gsb")
+
+    startTime = time.time()
+    gestures = gestureBinary.readCsvGestures(inputName, numGestures, numServos, yamlConfigs.get("gestureDelimiter", "*"))
+    gestureBinary.writeGestureFile(outputName, gestures, numServos, yamlConfigs.get("gestureNames"),
+                                   yamlConfigs.get("servoLimits"))
+
+    numFrames = sum([len(frames) for frames in gestures])
+    print("Wrote " + str(numGestures) + " gestures (" + str(numFrames) + " frames) to " + outputName +
+          " in " + str(round(time.time() - startTime, 3)) + " seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,16 @@
 # Created by Skyler Williams
 #
 # Programatically generate C++ Arduino files using YAML configs options
+#
+# Run with no arguments to generate the sketch for gesturerConfigs.yaml, or
+# with --builds to generate every sketch in the firmwareBuilds matrix.
 
 # Import standard libraries
 import os
 import sys
 import inspect
+import itertools
+import time
 
 # Get the path to the current directory so we can add 3rd-party libraries
 currentDirectory = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
@@ -19,152 +24,436 @@ else:
     addonLibs = currentDirectory + "/python2Libs/"
 # Make 3rd party libraries available for import
 sys.path.append(addonLibs)
-# Import 3rd party libraries
-import yaml
-
-
-def generateServoObjects(outputFile, offsetLine, numServos):
+# The configs loader is shared with the addon, and works with either version
+# of Python
+if sys.version_info < (3, 0):
+    sys.path.append(currentDirectory + "/addon-gestureDeveloper/")
+import gestureBinary
+import gestureCompression
+import gesturerConfigs
+import servoMap
+import sketchTemplate
+
+# Options a sketch is generated from, and which of them a build in the
+# firmwareBuilds matrix may give a list of values for
+SKETCH_OPTIONS = ["servoPins", "servoLimits", "motorIdentification", "serialProtocol", "deltaUpdates",
+                  "firmwareLayout", "baudRate", "baudRates", "frameRate"]
+MATRIX_OPTIONS = ["motorIdentification", "serialProtocol", "deltaUpdates", "firmwareLayout", "baudRate"]
+
+# Gestures read from the CSV file for playback sketches, read only once
+csvGestures = None
+
+
+def generateServoObjects(sketch):
     servoObjectsString = ""
-    for i in range(numServos):
+    for i in range(sketch["numServos"]):
         servoObjectsString += ("Servo myServo" + str(i) + ";\n")
-        offsetLine += 1
-    outputFile.write(servoObjectsString)
+    return servoObjectsString
+
+
+def generateNumServos(sketch):
+    return "int numServos = " + str(sketch["numServos"]) + ";\n"
 
 
-def generateServoPins(outputFile, offsetLine, numServos, servoPins):
+def generateServoPins(sketch):
     servoPinsString = ""
-    for i in range (numServos):
-        servoPinsString += ("int servoPin" + str(i) + " = " + str(servoPins[i]) + ";\n")
-        offsetLine += 1
-    outputFile.write(servoPinsString)
+    for i in range(sketch["numServos"]):
+        servoPinsString += ("int servoPin" + str(i) + " = " + str(sketch["servoPins"][i]) + ";\n")
+    return servoPinsString
 
 
-def generateAttachServos(outputFile, offsetLine, numServos):
+def generateAttachServos(sketch):
     attachServosString = ""
-    for i in range (numServos):
+    for i in range(sketch["numServos"]):
         attachServosString += ("  myServo" + str(i) + ".attach(servoPin" + str(i) + ");\n")
-        offsetLine += 1
-    outputFile.write(attachServosString)
-
-
-def generateServoSwitch(outputFile, offsetLine, numServos):
-    servoAttachString = ""
-    servoAttachString += "    switch (currentServo) {\n"
-    offsetLine += 1;
-    for i in range (numServos):
-        servoAttachString += ("      case " + str(i) + ":\n")
-        servoAttachString += ("        myServo" + str(i) + ".write(data);\n")
-        servoAttachString += ("        break;\n")
-        offsetLine += 3
-    servoAttachString += "    }\n"
-    offsetLine += 1
-    outputFile.write(servoAttachString)
-
-
-def generateAddressingSwitch(outputFile, offsetLine, numServos):
-    addressingSwitchString = ""
-    addressingSwitchString += "    } else {\n"
-    addressingSwitchString += "      switch (currentServo) {\n"
-    offsetLine += 2
-    for i in range (numServos):
-        addressingSwitchString += ("    case " + str(i) + ":\n")
-        addressingSwitchString += ("        myServo" + str(i) + ".write(data);\n")
-        addressingSwitchString += ("        break;\n")
-        offsetLine += 3
-    addressingSwitchString += "      }\n"
-    addressingSwitchString += "    }\n"
-    offsetLine += 2
-    outputFile.write(addressingSwitchString)
-
-
-def generateCurrentServoIncrement(outputFile, offsetLine, numServos):
+    return attachServosString
+
+
+def generateServoSwitch(sketch):
+    servoSwitchString = ""
+    servoSwitchString += "    switch (currentServo) {\n"
+    for i in range(sketch["numServos"]):
+        servoSwitchString += ("      case " + str(i) + ":\n")
+        servoSwitchString += ("        myServo" + str(i) + ".write(data);\n")
+        servoSwitchString += ("        break;\n")
+    servoSwitchString += "    }\n"
+    return servoSwitchString
+
+
+def generateCurrentServoIncrement(sketch):
+    # With addressing, the host sends the address of each servo it writes
+    if sketch["motorIdentification"] == "addressing":
+        return ""
     currentServoIncrementString = ""
     currentServoIncrementString += ("    ++currentServo;\n")
     currentServoIncrementString += ("    if (currentServo == numServos) {\n")
     currentServoIncrementString += ("        currentServo = 0;\n")
-    currentServoIncrementString += ("    }")
-    offsetLine += 4
-    outputFile.write(currentServoIncrementString)
+    currentServoIncrementString += ("    }\n")
+    return currentServoIncrementString
 
 
-
-def generateReceiveAddressByte(outputFile, offsetLine, numServos):
+def generateUpperBound(sketch):
+    if sketch["motorIdentification"] != "addressing":
+        return "      data = 180;\n"
+    # Address bytes only select the servo the next byte is written to
     receiveAddressByteString = ""
     receiveAddressByteString += ("      currentServo = data - 181;\n")
     receiveAddressByteString += ("      currentServo = (currentServo < 0) ? 0 : currentServo;\n")
-    offsetLine += 2
-    outputFile.write(receiveAddressByteString)
+    receiveAddressByteString += ("      return;\n")
+    return receiveAddressByteString
+
+
+def generateFrameBuffer(sketch):
+    frameBufferString = ""
+    frameBufferString += ("int frameAngles[" + str(sketch["numServos"]) + "];\n")
+    frameBufferString += ("int packetAngles[" + str(sketch["numServos"]) + "];\n")
+    return frameBufferString + generateServoMask(sketch, "packetMask")
+
+
+def generateServoMask(sketch, maskName="servoMask"):
+    # Delta masks carry seven servos per byte
+    maskBytes = (sketch["numServos"] + 6) // 7
+    servoMaskString = ""
+    servoMaskString += ("const int maskBytes = " + str(maskBytes) + ";\n")
+    servoMaskString += ("int " + maskName + "[" + str(maskBytes) + "];\n")
+    return servoMaskString
+
+
+def generateFrameWrites(sketch):
+    frameWritesString = ""
+    for i in range(sketch["numServos"]):
+        frameWritesString += ("        myServo" + str(i) + ".write(frameAngles[" + str(i) + "]);\n")
+    return frameWritesString
+
+
+def generateServoTable(sketch):
+    numServos = str(sketch["numServos"])
+    servoTableString = ""
+    servoTableString += ("const int numServos = " + numServos + ";\n")
+    servoTableString += ("Servo servos[" + numServos + "];\n")
+    servoTableString += ("const int servoPins[" + numServos + "] = {" + ", ".join([str(pin) for pin in sketch["servoPins"]]) + "};\n")
+    servoTableString += ("const int servoLower[" + numServos + "] = {" + ", ".join([str(lower) for lower, upper in sketch["servoLimits"]]) + "};\n")
+    servoTableString += ("const int servoUpper[" + numServos + "] = {" + ", ".join([str(upper) for lower, upper in sketch["servoLimits"]]) + "};\n")
+    return servoTableString
+
+
+def generateTableFrameBuffer(sketch):
+    # Delta masks carry seven servos per byte
+    maskBytes = (sketch["numServos"] + 6) // 7
+    frameBufferString = ""
+    frameBufferString += ("int frameAngles[" + str(sketch["numServos"]) + "];\n")
+    frameBufferString += ("const unsigned int maskBytes = " + str(maskBytes) + ";\n")
+    return frameBufferString
+
+
+def generateRingBuffer(sketch):
+    # Room for two of the longest packets (a sequenced delta packet with
+    # every servo), as a power of two so indices wrap with a mask
+    numServos = sketch["numServos"]
+    maxPacketLength = 3 + (numServos + 6) // 7 + numServos + 1
+    ringSize = 64
+    while ringSize < 2 * maxPacketLength:
+        ringSize *= 2
+    ringBufferString = ""
+    ringBufferString += ("const unsigned int ringSize = " + str(ringSize) + ";\n")
+    ringBufferString += ("byte ring[" + str(ringSize) + "];\n")
+    return ringBufferString
+
+
+def generateGestureTables(sketch):
+    numGestures = str(len(sketch["gestures"]))
+    gestureTablesString = ""
+    gestureTablesString += ("const int numGestures = " + numGestures + ";\n")
+    gestureTablesString += ("const unsigned long framePeriod = " + str(int(round(1000000. / sketch["frameRate"]))) + ";\n")
+    for i in range(len(sketch["gestures"])):
+        name, numFrames, compressed = sketch["gestures"][i]
+        gestureTablesString += ("// " + name + ", " + str(numFrames) + " frames\n")
+        gestureTablesString += ("const byte gesture" + str(i) + "[] PROGMEM = {\n")
+        for start in range(0, len(compressed), 16):
+            gestureTablesString += ("  " + ", ".join([str(value) for value in compressed[start:start + 16]]) + ",\n")
+        gestureTablesString += ("};\n")
+    gestureTablesString += ("const byte* const gestureData[" + numGestures + "] PROGMEM = {" +
+                            ", ".join(["gesture" + str(i) for i in range(len(sketch["gestures"]))]) + "};\n")
+    gestureTablesString += ("const unsigned int gestureFrames[" + numGestures + "] PROGMEM = {" +
+                            ", ".join([str(numFrames) for name, numFrames, compressed in sketch["gestures"]]) + "};\n")
+    return gestureTablesString
+
+
+def generateBaudRates(sketch):
+    baudRate = sketch["baudRate"]
+    baudRates = sketch["baudRates"]
+    # Always have a table to index into, even if negotiation is not used
+    if len(baudRates) == 0:
+        baudRates = [baudRate]
+    baudRatesString = ""
+    baudRatesString += ("const long initialBaudRate = " + str(baudRate) + ";\n")
+    baudRatesString += ("// Byte the host sends to ask for the baud rate at the index following it\n")
+    baudRatesString += ("const int baudCommand = 253;\n")
+    baudRatesString += ("const int numBaudRates = " + str(len(baudRates)) + ";\n")
+    baudRatesString += ("const long baudRates[" + str(len(baudRates)) + "] = {" + ", ".join(map(str, baudRates)) + "};\n")
+    baudRatesString += ("\n")
+    baudRatesString += ("// Switch to the requested baud rate, keeping it only if the host confirms\n")
+    baudRatesString += ("// by repeating the request at the new rate within a second\n")
+    baudRatesString += ("void switchBaudRate(int rateIndex) {\n")
+    baudRatesString += ("  if (rateIndex >= numBaudRates) {\n")
+    baudRatesString += ("    return;\n")
+    baudRatesString += ("  }\n")
+    baudRatesString += ("  Serial.write(baudCommand);\n")
+    baudRatesString += ("  Serial.write(rateIndex);\n")
+    baudRatesString += ("  Serial.flush();\n")
+    baudRatesString += ("  Serial.begin(baudRates[rateIndex]);\n")
+    baudRatesString += ("  unsigned long startTime = millis();\n")
+    baudRatesString += ("  while (millis() - startTime < 1000) {\n")
+    baudRatesString += ("    if (Serial.available() >= 2) {\n")
+    baudRatesString += ("      if (Serial.read() == baudCommand && Serial.read() == rateIndex) {\n")
+    baudRatesString += ("        Serial.write(baudCommand);\n")
+    baudRatesString += ("        Serial.write(rateIndex);\n")
+    baudRatesString += ("        return;\n")
+    baudRatesString += ("      }\n")
+    baudRatesString += ("      break;\n")
+    baudRatesString += ("    }\n")
+    baudRatesString += ("  }\n")
+    baudRatesString += ("  Serial.end();\n")
+    baudRatesString += ("  Serial.begin(initialBaudRate);\n")
+    baudRatesString += ("}\n")
+    baudRatesString += ("\n")
+    baudRatesString += ("// Read the index of the requested baud rate following the baud command\n")
+    baudRatesString += ("void negotiateBaudRate() {\n")
+    baudRatesString += ("  while (!Serial.available()) {}\n")
+    baudRatesString += ("  switchBaudRate(Serial.read());\n")
+    baudRatesString += ("}\n")
+    return baudRatesString
+
+
+# Code generated for each template marker
+SECTIONS = {
+    "servoObjects": generateServoObjects,
+    "numServos": generateNumServos,
+    "servoPins": generateServoPins,
+    "attachServos": generateAttachServos,
+    "servoSwitch": generateServoSwitch,
+    "currentServoIncrement": generateCurrentServoIncrement,
+    "upperBound": generateUpperBound,
+    "frameBuffer": generateFrameBuffer,
+    "frameWrites": generateFrameWrites,
+    "servoMask": generateServoMask,
+    "baudRates": generateBaudRates,
+    "servoTable": generateServoTable,
+    "tableFrameBuffer": generateTableFrameBuffer,
+    "ringBuffer": generateRingBuffer,
+    "gestureTables": generateGestureTables,
+}
+
+
+# sketchOptions(configs, build)
+#
+# The options of the sketch for the configs, with the options set in a build
+# of the firmwareBuilds matrix taking their place.
+def sketchOptions(configs, build=None):
+    servos = servoMap.ServoMap.fromConfigs(configs)
+    sketch = {
+        "servoPins": servos.pins,
+        "servoLimits": servos.limits,
+        "motorIdentification": configs["motorIdentification"],
+        # Older configs predate the packet protocol, so default to the echo
+        # scheme
+        "serialProtocol": configs.get("serialProtocol", "echo"),
+        "deltaUpdates": configs.get("deltaUpdates", False),
+        # Whether the packet receiver is unrolled per servo or loops over
+        # tables
+        "firmwareLayout": configs.get("firmwareLayout", "unrolled"),
+        "baudRate": configs.get("baudRate", 9600),
+        "baudRates": configs.get("baudRates", []),
+        "frameRate": configs.get("frameRate", 24),
+    }
+    if build is not None:
+        for key in SKETCH_OPTIONS:
+            if key in build:
+                sketch[key] = build[key]
+        # Builds for robots with other servos give their own pins, and limits
+        # unless they use the full range
+        if "servoPins" in build:
+            if "servoLimits" not in build:
+                sketch["servoLimits"] = None
+            elif len(build["servoLimits"]) != len(build["servoPins"]):
+                raise gesturerConfigs.ConfigError("firmwareBuilds: " + str(build.get("name")) +
+                                                  " needs servoLimits for each of its servoPins")
+        sketch["servoPins"] = [int(pin) for pin in sketch["servoPins"]]
+        sketch["servoLimits"] = gestureBinary.normalizeLimits(len(sketch["servoPins"]), sketch["servoLimits"])
+
+    sketch["numServos"] = len(sketch["servoPins"])
+    sketch["templateName"], sketch["outputName"] = sketchVariant(sketch)
+    if sketch["serialProtocol"] == "playback":
+        sketch["gestures"] = compileGestures(configs, sketch)
+    return sketch
+
+
+# compileGestures(configs, sketch)
+#
+# The gestures in the CSV file, followed by the playbackReversedGestures
+# played backwards, clamped to the limits of the sketch's servos and
+# compressed for flash, as a list of (name, number of frames, compressed
+# bytes).
+def compileGestures(configs, sketch):
+    global csvGestures
+
+    numObjects = configs["numObjects"]
+    if sketch["numServos"] != numObjects:
+        raise gesturerConfigs.ConfigError("playback sketches need a pin for each of the " + str(numObjects) +
+                                          " servos the gestures were animated with")
+    reversedGestures = configs.get("playbackReversedGestures", [])
+    for gestureId in reversedGestures:
+        if not isinstance(gestureId, int) or not 0 <= gestureId < configs["numGestures"]:
+            raise gesturerConfigs.ConfigError("playbackReversedGestures must only hold numbers of gestures, not " +
+                                              str(gestureId))
+    # Gesture numbers share the command byte with the stop and baud commands
+    if configs["numGestures"] + len(reversedGestures) >= 252:
+        raise gesturerConfigs.ConfigError("playback sketches can hold at most 251 gestures, counting the reversed ones")
+    if csvGestures is None:
+        csvGestures = gestureBinary.readCsvGestures(configs["csvOutputName"], configs["numGestures"], numObjects,
+                                                    configs.get("gestureDelimiter", "*"))
+    names = list(configs.get("gestureNames", []))[:len(csvGestures)]
+    names += gestureBinary.defaultGestureNames(len(csvGestures))[len(names):]
+    names += [str(names[gestureId]) + "_reversed" for gestureId in reversedGestures]
+
+    gestures = []
+    playback = gestureBinary.playbackGestures(csvGestures, reversedGestures)
+    for i in range(len(playback)):
+        frames = [gestureBinary.clampRow(row, sketch["servoLimits"]) for row in playback[i]]
+        gestures.append((str(names[i]), len(frames), gestureCompression.compressGesture(frames)))
+    return gestures
+
+
+# reportGestures(sketch, flashBytes)
+#
+# Prints the size of each gesture compiled into a playback sketch, and warns
+# if they take more than flashBytes of flash.
+def reportGestures(sketch, flashBytes):
+    totalBytes = 0
+    print(sketch["outputName"] + ":")
+    for name, numFrames, compressed in sketch["gestures"]:
+        rawBytes = numFrames * sketch["numServos"]
+        totalBytes += len(compressed)
+        print("  " + name + ": " + str(numFrames) + " frames, " + str(rawBytes) + " bytes compressed to " +
+              str(len(compressed)) + " bytes")
+    print("  " + str(totalBytes) + " bytes of gestures in flash")
+    if totalBytes > flashBytes:
+        print("  Warning: the gestures take more than the " + str(flashBytes) + " bytes of flash set aside for them "
+              "(playbackFlashBytes)")
+
+
+# sketchVariant(sketch)
+#
+# The template a sketch is generated from, and the name of the sketch.
+def sketchVariant(sketch):
+    numServos = str(sketch["numServos"])
+    # Gestures are played from flash, the host only says which one
+    if (sketch["serialProtocol"] == "playback"):
+        return "motors_playback_template.ino", "playback_" + numServos + "_motors"
+    # Windowed senders use the same receiver, with sequence numbered packets
+    if (sketch["serialProtocol"] == "packet" or sketch["serialProtocol"] == "windowed"):
+        if (sketch["firmwareLayout"] == "table"):
+            return "motors_table_template.ino", "table_" + numServos + "_motors"
+        return "motors_packet_template.ino", "packet_" + numServos + "_motors"
+    if (sketch["motorIdentification"] == "addressing"):
+        return "motors_template.ino", "addressing_" + numServos + "_motors"
+    # Addressing already skips unchanged servos, switching needs the frames
+    # to start with a mask of the changed servos
+    if (sketch["deltaUpdates"] == True):
+        return "motors_delta_template.ino", "switching_delta_" + numServos + "_motors"
+    return "motors_template.ino", "switching_" + numServos + "_motors"
+
+
+# generateSketch(sketch)
+#
+# The code of a sketch, from its template in the current directory.
+def generateSketch(sketch):
+    templateName = sketch["templateName"]
+    template = sketchTemplate.loadTemplate(templateName)
+    # Only generate the code the template has markers for
+    sections = {}
+    for name in sketchTemplate.markerNames(template):
+        if name in SECTIONS:
+            sections[name] = SECTIONS[name](sketch)
+
+    sketchString = ""
+    sketchString += ("// Generated by generateSwitchingTemplate.py with " + templateName + " as\n")
+    sketchString += ("// base code, both written by Skyler Williams.\n")
+    sketchString += ("// \n")
+    sketchString += ("// Code for working with Blender Gesture Developer addon.\n")
+    sketchString += ("// \n")
+    return sketchString + sketchTemplate.renderTemplate(template, sections, templateName)
+
+
+# expandBuilds(configs)
+#
+# The sketch of each build in the firmwareBuilds matrix, with a sketch for
+# every combination of the values listed for its MATRIX_OPTIONS. Sketches are
+# named after their build, and after their baud rate when a build lists more
+# than one. Combinations giving the same sketch (e.g. the packet and windowed
+# protocols) are only generated once.
+def expandBuilds(configs):
+    sketches = []
+    names = set()
+    for build in configs.get("firmwareBuilds", []):
+        listed = [key for key in MATRIX_OPTIONS if isinstance(build.get(key), list)]
+        for values in itertools.product(*[build[key] for key in listed]):
+            combination = dict(build)
+            combination.update(zip(listed, values))
+            sketch = sketchOptions(configs, combination)
+
+            sketchName = str(build["name"]) + "_" + sketch["outputName"]
+            if "baudRate" in listed:
+                sketchName += "_" + str(sketch["baudRate"])
+            if sketchName in names:
+                continue
+            names.add(sketchName)
+            sketch["outputName"] = sketchName
+            sketches.append(sketch)
+    return sketches
+
+
+# writeSketch(sketch, directory)
+#
+# Writes a sketch, in a folder of its own name as the Arduino IDE expects when
+# a directory is given.
+def writeSketch(sketch, directory=None):
+    fileName = sketch["outputName"] + ".ino"
+    if directory is not None:
+        sketchDirectory = os.path.join(directory, sketch["outputName"])
+        if not os.path.isdir(sketchDirectory):
+            os.makedirs(sketchDirectory)
+        fileName = os.path.join(sketchDirectory, fileName)
+    outputFile = open(fileName, "w")
+    outputFile.write(generateSketch(sketch))
+    outputFile.close()
+    return fileName
 
 
 def main():
 
-    # fileName = os.path.join(os.path.dirname(bpy.data.filepath), "../arduino/switching_motors_template/switching_motors_template.ino")
-    switchingTemplate = open("motors_template.ino")
-
-    yamlFileStream = open("gesturerConfigs.yaml").read()
-    yamlConfigs = yaml.load(yamlFileStream, Loader=yaml.Loader)
-    
-    servoPins = yamlConfigs["servoPins"]
-    numServos = yamlConfigs["numObjects"]
-    motorIdentification = yamlConfigs["motorIdentification"]
-
-    if (motorIdentification == "addressing"):
-        outputFileName = "addressing_" + str(numServos) + "_motors.ino"
-        insertionLines = yamlConfigs["addressingOffsets"]
-    elif (motorIdentification == "switching"):
-        outputFileName = "switching_" + str(numServos) + "_motors.ino"
-        insertionLines = yamlConfigs["switchingOffsets"]
-    else:
-        outputFileName = "switching_" + str(numServos) + "_motors.ino"
-        insertionLines = yamlConfigs["switchingOffsets"]
-
-    templateLine = 0
-    offsetLine = 0
-
-    outputFile = open(outputFileName, "w")
-
-    outputFile.write("// Generated by generateSwitchingTemplate.py with motors_template.ino as\n")
-    outputFile.write("// base code, both written by Skyler Williams.\n")
-    outputFile.write("// \n")
-    outputFile.write("// Code for working with Blender Gesture Developer addon.\n")
-    outputFile.write("// \n")
-
-    replaceWithAddressingSwitch = False
-
-    for line in switchingTemplate:        
-
-        if templateLine in insertionLines:
-            printObject = insertionLines[templateLine]
-
-            if (printObject == "servoObjects"):
-                generateServoObjects(outputFile, offsetLine, numServos)
-            elif (printObject == "numServos"):
-                outputFile.write("int numServos = " + str(numServos) + ";\n")
-            elif (printObject == "servoPins"):
-                generateServoPins(outputFile, offsetLine, numServos, servoPins)
-            elif (printObject == "attachServos"):
-                generateAttachServos(outputFile, offsetLine, numServos)
-            elif (printObject == "servoSwitch"):
-                generateServoSwitch(outputFile, offsetLine, numServos)
-            elif (printObject == "currentServoIncrement"):
-                generateCurrentServoIncrement(outputFile, offsetLine, numServos)
-            elif (printObject == "receiveAddressByte"):
-                generateReceiveAddressByte(outputFile, offsetLine, numServos)
-            elif (printObject == "exceedsUpperBound"):
-                outputFile.write("      data = 180;\n")
-            elif (printObject == "addressingSwitch"):
-                replaceWithAddressingSwitch = True
-                generateAddressingSwitch(outputFile, offsetLine, numServos)
-
-            if (replaceWithAddressingSwitch == False):
-                outputFile.write(line)
-            offsetLine += 1
-            templateLine += 1
-            replaceWithAddressingSwitch = False
-        else:
-            outputFile.write(line)
-            offsetLine += 1
-            templateLine += 1
+    yamlConfigs = gesturerConfigs.loadConfigs("gesturerConfigs.yaml")
+
+    # Roughly what an Uno has left for gestures once the code is in flash
+    flashBytes = yamlConfigs.get("playbackFlashBytes", 28000)
+
+    if "--builds" not in sys.argv[1:]:
+        sketch = sketchOptions(yamlConfigs)
+        writeSketch(sketch)
+        if "gestures" in sketch:
+            reportGestures(sketch, flashBytes)
+        return
+
+    startTime = time.time()
+    sketches = expandBuilds(yamlConfigs)
+    firmwareDirectory = yamlConfigs.get("firmwareDirectory", "firmware")
+    for sketch in sketches:
+        writeSketch(sketch, firmwareDirectory)
+    for sketch in sketches:
+        if "gestures" in sketch:
+            reportGestures(sketch, flashBytes)
+    print("Generated " + str(len(sketches)) + " sketches in " + firmwareDirectory + " in " +
+          str(round((time.time() - startTime) * 1000, 1)) + " ms")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+#include <Servo.h>
+// Servo definitions {{servoObjects}}
+// Number of servos {{numServos}}
+// Servo pin definitions {{servoPins}}
+// Mask of the servos changed in the frame being received {{servoMask}}
+// Baud rates and negotiation with the host {{baudRates}}
+// Type is "byte" so we get an unsigned 8-bit value
+int data;
+int currentServo = 0;
+// Number of mask bytes received for the current frame
+int maskIndex = 0;
+
+// The next servo at or after "servo" changed in the current frame
+int nextServo(int servo) {
+  while (servo < numServos && !((servoMask[servo / 7] >> (servo % 7)) & 1)) {
+    ++servo;
+  }
+  return servo;
+}
+
+void setup() {
+  // Attaching servos {{attachServos}}
+  Serial.begin(initialBaudRate);
+}
+
+void loop() {
+  // If Serial data is available
+  if(Serial.available()) {
+    // Read serial data and write back for error check
+    data = Serial.read();      
+    // Negotiate a faster baud rate when the host asks for one
+    if (data == baudCommand) {
+      negotiateBaudRate();
+      return;
+    }
+    Serial.write(data);
+    // Each frame starts with a mask of the servos changed in it, seven
+    // servos per byte, followed by the angles of those servos only
+    if (maskIndex < maskBytes) {
+      servoMask[maskIndex] = data;
+      ++maskIndex;
+      if (maskIndex == maskBytes) {
+        currentServo = nextServo(0);
+      }
+    } else {
+      // Bounds check data for the motors
+      if (data > 180) {
+        data = 180;
+      }
+      // Switch on currentServo and write {{servoSwitch}}
+      // Move on to the next changed servo
+      currentServo = nextServo(currentServo + 1);
+    }
+    // Once every changed servo is written, wait for the next frame's mask
+    if (maskIndex == maskBytes && currentServo == numServos) {
+      maskIndex = 0;
+    }
+  }
+}
@@ -0,0 +1,110 @@
+#include <Servo.h>
+// Servo definitions {{servoObjects}}
+// Number of servos {{numServos}}
+// Servo pin definitions {{servoPins}}
+// Buffers for the frame being received and the mask of a delta packet {{frameBuffer}}
+// Baud rates and negotiation with the host {{baudRates}}
+// Start of a frame packet, and of a sequence numbered frame packet, neither
+// is ever a valid angle, sequence number or checksum
+const int frameStart = 255;
+const int sequencedFrameStart = 254;
+// Terminates the acknowledgement of a sequence numbered packet
+const int ackEnd = 255;
+// Set in the servo count of delta packets, which only carry changed servos
+const int deltaFlag = 128;
+int data;
+// Packet parsing state: 0 waiting for start, 1 count, 2 angles, 3 checksum,
+// 4 sequence number, 5 delta mask
+int packetState = 0;
+int packetIndex = 0;
+int packetSum = 0;
+bool packetSequenced = false;
+int packetSequence = 0;
+bool packetDelta = false;
+
+// Whether a servo is included in the delta packet being received
+bool servoChanged(int servo) {
+  return (packetMask[servo / 7] >> (servo % 7)) & 1;
+}
+
+// The next servo at or after "servo" included in the packet being received
+int nextServo(int servo) {
+  while (packetDelta && servo < numServos && !servoChanged(servo)) {
+    ++servo;
+  }
+  return servo;
+}
+
+void setup() {
+  // Attaching servos {{attachServos}}
+  Serial.begin(initialBaudRate);
+}
+
+void loop() {
+  // If Serial data is available
+  if(Serial.available()) {
+    data = Serial.read();
+    // A start byte always begins a new packet, so a lost byte only costs
+    // the frame it belonged to
+    if (data == frameStart || data == sequencedFrameStart) {
+      packetSequenced = (data == sequencedFrameStart);
+      packetState = packetSequenced ? 4 : 1;
+      packetSum = 0;
+    } else if (packetState == 0 && data == baudCommand) {
+      // Negotiate a faster baud rate when the host asks for one, only
+      // between packets since checksums can take the same value
+      negotiateBaudRate();
+    } else if (packetState == 4) {
+      packetSequence = data;
+      packetSum = data;
+      packetState = 1;
+    } else if (packetState == 1) {
+      // Only accept frames covering every servo
+      packetDelta = (data & deltaFlag) != 0;
+      if ((data & ~deltaFlag) != numServos) {
+        packetState = 0;
+      } else {
+        packetState = packetDelta ? 5 : 2;
+      }
+      packetSum += data;
+      packetIndex = 0;
+    } else if (packetState == 5) {
+      packetMask[packetIndex] = data;
+      packetSum += data;
+      ++packetIndex;
+      if (packetIndex == maskBytes) {
+        packetIndex = nextServo(0);
+        packetState = (packetIndex == numServos) ? 3 : 2;
+      }
+    } else if (packetState == 2) {
+      // Bounds check data for the motors
+      packetAngles[packetIndex] = (data > 180) ? 180 : data;
+      packetSum += data;
+      packetIndex = nextServo(packetIndex + 1);
+      if (packetIndex == numServos) {
+        packetState = 3;
+      }
+    } else if (packetState == 3) {
+      // Acknowledge the frame with the checksum we computed, along with the
+      // sequence number for sequenced packets
+      packetSum = packetSum % 254;
+      if (packetSequenced) {
+        Serial.write(packetSequence);
+      }
+      Serial.write(packetSum);
+      if (packetSequenced) {
+        Serial.write(ackEnd);
+      }
+      if (packetSum == data) {
+        // Servos left out of a delta packet keep their angles
+        for (int i = 0; i < numServos; ++i) {
+          if (!packetDelta || servoChanged(i)) {
+            frameAngles[i] = packetAngles[i];
+          }
+        }
+        // Write the whole frame out to the servos {{frameWrites}}
+      }
+      packetState = 0;
+    }
+  }
+}
@@ -0,0 +1,111 @@
+#include <Servo.h>
+#include <avr/pgmspace.h>
+// Servos with their pins and limits {{servoTable}}
+// Compressed frames of each gesture in flash, and the time between frames {{gestureTables}}
+// Baud rates and negotiation with the host {{baudRates}}
+// Operations the frames are compressed into (see gestureCompression.py): a
+// held frame, the last change again, changes of four or eight bits per
+// servo, or the angles of every servo
+const byte holdOp = 0x00;
+const byte repeatOp = 0x40;
+const byte nibbleOp = 0x80;
+const byte byteOp = 0xC0;
+const byte keyframeOp = 0xFF;
+// The host sends the number of a gesture to play it from the start, or this
+// to stop playing, and the number of a gesture is sent back once it finished
+const int stopCommand = 252;
+
+// Gesture being played, or -1 when none is
+int playing = -1;
+// Next byte of the gesture to decode and the frames left to play
+const byte* gesturePosition;
+unsigned int framesLeft = 0;
+// Operation being decoded and the frames it still covers
+byte op;
+byte opFramesLeft = 0;
+int frameAngles[numServos];
+int lastChange[numServos];
+// Time in microseconds the next frame is due at
+unsigned long frameDue;
+
+void startGesture(int gesture) {
+  playing = gesture;
+  gesturePosition = (const byte*)pgm_read_word(&gestureData[gesture]);
+  framesLeft = pgm_read_word(&gestureFrames[gesture]);
+  opFramesLeft = 0;
+  frameDue = micros();
+}
+
+// Decode the next frame of the gesture into frameAngles
+void decodeFrame() {
+  if (opFramesLeft == 0) {
+    op = pgm_read_byte(gesturePosition++);
+    opFramesLeft = (op == keyframeOp) ? 1 : (op & 0x3F) + 1;
+  }
+  --opFramesLeft;
+  --framesLeft;
+
+  if (op == keyframeOp) {
+    for (int i = 0; i < numServos; ++i) {
+      frameAngles[i] = pgm_read_byte(gesturePosition++);
+      lastChange[i] = 0;
+    }
+    return;
+  }
+  if (op >= byteOp) {
+    for (int i = 0; i < numServos; ++i) {
+      lastChange[i] = (int8_t)pgm_read_byte(gesturePosition++);
+    }
+  } else if (op >= nibbleOp) {
+    for (int i = 0; i < numServos; ++i) {
+      int value = (pgm_read_byte(gesturePosition + i / 2) >> (4 * (i % 2))) & 0x0F;
+      lastChange[i] = (value >= 8) ? value - 16 : value;
+    }
+    gesturePosition += (numServos + 1) / 2;
+  }
+  // Held frames leave the servos where they are
+  if (op >= repeatOp) {
+    for (int i = 0; i < numServos; ++i) {
+      frameAngles[i] += lastChange[i];
+    }
+  }
+}
+
+// Play the frames that are due, writing only the newest if we fell behind
+void playFrames() {
+  if (playing < 0 || (long)(micros() - frameDue) < 0) {
+    return;
+  }
+  while (framesLeft > 0 && (long)(micros() - frameDue) >= 0) {
+    decodeFrame();
+    frameDue += framePeriod;
+  }
+  for (int i = 0; i < numServos; ++i) {
+    servos[i].write(constrain(frameAngles[i], servoLower[i], servoUpper[i]));
+  }
+  if (framesLeft == 0) {
+    Serial.write(playing);
+    playing = -1;
+  }
+}
+
+void setup() {
+  for (int i = 0; i < numServos; ++i) {
+    servos[i].attach(servoPins[i]);
+  }
+  Serial.begin(initialBaudRate);
+}
+
+void loop() {
+  if (Serial.available()) {
+    int data = Serial.read();
+    if (data == baudCommand) {
+      negotiateBaudRate();
+    } else if (data == stopCommand) {
+      playing = -1;
+    } else if (data < numGestures) {
+      startGesture(data);
+    }
+  }
+  playFrames();
+}
@@ -0,0 +1,170 @@
+#include <Servo.h>
+// Servos with their pins and limits {{servoTable}}
+// Angles the servos were last set to, and bytes in a delta mask {{tableFrameBuffer}}
+// Ring buffer for received bytes {{ringBuffer}}
+// Baud rates and negotiation with the host {{baudRates}}
+// Start of a frame packet, and of a sequence numbered frame packet, neither
+// is ever a valid angle, sequence number or checksum
+const int frameStart = 255;
+const int sequencedFrameStart = 254;
+// Terminates the acknowledgement of a sequence numbered packet
+const int ackEnd = 255;
+// Set in the servo count of delta packets, which only carry changed servos
+const int deltaFlag = 128;
+// Received bytes are written at ringHead and parsed from ringTail, both only
+// ever count up and are wrapped into the ring when indexing
+unsigned int ringHead = 0;
+unsigned int ringTail = 0;
+
+// Number of received bytes not yet parsed
+unsigned int ringCount() {
+  return ringHead - ringTail;
+}
+
+// The byte "offset" bytes after the next one to parse
+int ringPeek(unsigned int offset) {
+  return ring[(ringTail + offset) & (ringSize - 1)];
+}
+
+// Move everything the serial port has received into the ring
+void fillRing() {
+  while (Serial.available() && ringCount() < ringSize) {
+    ring[ringHead & (ringSize - 1)] = Serial.read();
+    ++ringHead;
+  }
+}
+
+// Whether a servo is included in the delta packet whose mask starts "offset"
+// bytes into the ring
+bool ringServoChanged(unsigned int offset, int servo) {
+  return (ringPeek(offset + servo / 7) >> (servo % 7)) & 1;
+}
+
+// Length of the packet at the start of the ring, 0 if more bytes are needed to
+// tell, or -1 if it cannot be a packet for these servos
+int packetLength() {
+  unsigned int header = (ringPeek(0) == sequencedFrameStart) ? 3 : 2;
+  if (ringCount() < header) {
+    return 0;
+  }
+  int count = ringPeek(header - 1);
+  // Only accept frames covering every servo
+  if ((count & ~deltaFlag) != numServos) {
+    return -1;
+  }
+  if ((count & deltaFlag) == 0) {
+    return header + numServos + 1;
+  }
+  if (ringCount() < header + maskBytes) {
+    return 0;
+  }
+  int length = header + maskBytes + 1;
+  for (int i = 0; i < numServos; ++i) {
+    if (ringServoChanged(header, i)) {
+      ++length;
+    }
+  }
+  return length;
+}
+
+// Acknowledge the complete packet at the start of the ring and, if its
+// checksum matches, apply the whole frame to the servos in one pass
+void applyPacket(int length) {
+  bool sequenced = (ringPeek(0) == sequencedFrameStart);
+  int packetSum = 0;
+  for (int i = 1; i < length - 1; ++i) {
+    packetSum += ringPeek(i);
+  }
+  // Acknowledge the frame with the checksum we computed, along with the
+  // sequence number for sequenced packets
+  packetSum = packetSum % 254;
+  if (sequenced) {
+    Serial.write(ringPeek(1));
+  }
+  Serial.write(packetSum);
+  if (sequenced) {
+    Serial.write(ackEnd);
+  }
+  if (packetSum != ringPeek(length - 1)) {
+    return;
+  }
+
+  int position = sequenced ? 2 : 1;
+  bool delta = (ringPeek(position) & deltaFlag) != 0;
+  ++position;
+  int maskStart = position;
+  if (delta) {
+    position += maskBytes;
+  }
+  // Servos left out of a delta packet keep their angles
+  for (int i = 0; i < numServos; ++i) {
+    if (!delta || ringServoChanged(maskStart, i)) {
+      frameAngles[i] = constrain(ringPeek(position), servoLower[i], servoUpper[i]);
+      ++position;
+    }
+  }
+  for (int i = 0; i < numServos; ++i) {
+    servos[i].write(frameAngles[i]);
+  }
+}
+
+// Parse every complete packet in the ring
+void parsePackets() {
+  while (ringCount() > 0) {
+    int data = ringPeek(0);
+    // Negotiate a faster baud rate when the host asks for one, only between
+    // packets since checksums can take the same value
+    if (data == baudCommand) {
+      if (ringCount() < 2) {
+        return;
+      }
+      int rateIndex = ringPeek(1);
+      ringTail += 2;
+      switchBaudRate(rateIndex);
+      continue;
+    }
+    // Skip anything that does not start a packet
+    if (data != frameStart && data != sequencedFrameStart) {
+      ++ringTail;
+      continue;
+    }
+    int length = packetLength();
+    if (length < 0) {
+      ++ringTail;
+      continue;
+    }
+    // A start byte inside the packet means bytes were lost, so start again
+    // from there and the lost bytes only cost the frame they belonged to
+    unsigned int received = ringCount();
+    if (length > 0 && (unsigned int)length < received) {
+      received = length;
+    }
+    unsigned int restart = 0;
+    for (unsigned int i = 1; i < received && restart == 0; ++i) {
+      if (ringPeek(i) == frameStart || ringPeek(i) == sequencedFrameStart) {
+        restart = i;
+      }
+    }
+    if (restart > 0) {
+      ringTail += restart;
+      continue;
+    }
+    if (length == 0 || ringCount() < (unsigned int)length) {
+      return;
+    }
+    applyPacket(length);
+    ringTail += length;
+  }
+}
+
+void setup() {
+  for (int i = 0; i < numServos; ++i) {
+    servos[i].attach(servoPins[i]);
+  }
+  Serial.begin(initialBaudRate);
+}
+
+void loop() {
+  fillRing();
+  parsePackets();
+}
@@ -1,14 +1,15 @@
 #include <Servo.h>
-// Servo definitions (line 2)
-// Number of servos (line 3)
-// Servo pin definitions (line 4)
+// Servo definitions {{servoObjects}}
+// Number of servos {{numServos}}
+// Servo pin definitions {{servoPins}}
+// Baud rates and negotiation with the host {{baudRates}}
 // Type is "byte" so we get an unsigned 8-bit value
 int data;
 int currentServo = 0;
 
 void setup() {
-  // Attaching servos (line 10)
-  Serial.begin(9600);
+  // Attaching servos {{attachServos}}
+  Serial.begin(initialBaudRate);
 }
 
 void loop() {
@@ -16,15 +17,20 @@ void loop() {
   if(Serial.available()) {
     // Read serial data and write back for error check
     data = Serial.read();      
+    // Negotiate a faster baud rate when the host asks for one
+    if (data == baudCommand) {
+      negotiateBaudRate();
+      return;
+    }
     Serial.write(data);
     // Bounds check data for the motors
     if (data < 0) {
         data = 0;
     } else if (data > 180) {
-      // Data exceeds 180 (24)
-      // Else + switch for addressing scheme (25)
-    } 
-    // Switch on currentServo and write (27)
-    // Increment the currentServo, and reset if over bounds (28)
+      // Data exceeds 180, so clamp it, or with addressing take it as the
+      // address of the servo to write next {{upperBound}}
+    }
+    // Switch on currentServo and write {{servoSwitch}}
+    // Increment the currentServo, and reset if over bounds {{currentServoIncrement}}
   }
 }
\ No newline at end of file
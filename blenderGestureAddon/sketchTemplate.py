@@ -0,0 +1,88 @@
+# sketchTemplate.py
+#
+# Templates for the Arduino code written by generateArduino.py. Code is
+# inserted at named markers rather than at line numbers: a marker is a
+# comment in the template ending in "{{name}}", and the code generated for
+# that name is inserted right after the comment (which is kept, without the
+# marker, to describe the code). Templates are parsed once into literal text
+# and marker names and cached, so generating many sketches from the same
+# template only joins strings. Works with either version of Python.
+
+import os
+import re
+
+MARKER = re.compile(r"\s*\{\{(\w+)\}\}\s*$")
+
+# Parsed templates by path, along with the modification time they were parsed
+# at
+templateCache = {}
+
+
+# TemplateError
+#
+# Raised when a template has a marker nothing is generated for.
+class TemplateError(ValueError):
+    pass
+
+
+# parseTemplate(text)
+#
+# Splits the text of a template into a list of parts, alternating between
+# literal text and the name of a marker (the first and last parts are always
+# literal text, possibly empty).
+def parseTemplate(text):
+    parts = []
+    literal = []
+    for line in text.splitlines(True):
+        match = MARKER.search(line)
+        if match is None:
+            literal.append(line)
+            continue
+        # Keep the comment, without the marker
+        ending = "\n" if line.endswith("\n") else ""
+        literal.append(line[:match.start()] + ending)
+        parts.append("".join(literal))
+        parts.append(match.group(1))
+        literal = []
+    parts.append("".join(literal))
+    return parts
+
+
+# loadTemplate(fileName)
+#
+# The parsed template in the file, parsed again only if the file changed.
+def loadTemplate(fileName):
+    path = os.path.abspath(fileName)
+    modified = os.path.getmtime(path)
+    cached = templateCache.get(path)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+
+    templateFile = open(path)
+    parts = parseTemplate(templateFile.read())
+    templateFile.close()
+    templateCache[path] = (modified, parts)
+    return parts
+
+
+# markerNames(parts)
+#
+# Names of the markers in a parsed template, in order.
+def markerNames(parts):
+    return parts[1::2]
+
+
+# renderTemplate(parts, sections, fileName)
+#
+# The text of a parsed template with the code for each marker inserted,
+# sections mapping marker names to the code to insert.
+def renderTemplate(parts, sections, fileName="template"):
+    rendered = []
+    for i in range(len(parts)):
+        if i % 2 == 0:
+            rendered.append(parts[i])
+        elif parts[i] in sections:
+            rendered.append(sections[parts[i]])
+        else:
+            raise TemplateError(fileName + ": nothing is generated for the marker {{" + parts[i] + "}}")
+    return "".join(rendered)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# playbackBench.py
+#
+# Benchmarks the playback loop of pythonGesturer (playGestures(), with its
+# frame_handler(), gestureSmooth() and frame scheduler) against a simulated
+# Arduino (see gestureSimulator in the addon) playing a synthetic gesture
+# library, so no hardware or Blender export is needed. Every combination of
+# the given servo counts, gesture counts, gesture lengths and protocols is
+# played for a fixed number of seconds, and the results are written as JSON
+# to compare against runs before and after a change.
+#
+# Usage: python bench/playbackBench.py [--servos 2 8] [--protocols echo packet]
+#        [--seconds 3] [--output results.json] (see --help for the rest)
+
+import argparse
+import contextlib
+import inspect
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+# pythonGesturer is one folder up, and imports serial before adding the addon
+# folder (with its copy of pySerial and the simulator) to the path
+currentDirectory = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+sys.path.append(os.path.join(currentDirectory, ".."))
+sys.path.append(os.path.join(currentDirectory, "../../blenderGestureAddon/addon-gestureDeveloper/"))
+import gestureProtocol
+import gestureSimulator
+
+import frameScheduler
+import gestureLibrary
+import gestureSmoothing
+import pythonGesturer
+
+STREAMING_PROTOCOLS = [gestureProtocol.ECHO_PROTOCOL, gestureProtocol.PACKET_PROTOCOL,
+                       gestureProtocol.WINDOWED_PROTOCOL]
+
+
+# BenchmarkFinished
+#
+# Raised by BenchScheduler once the benchmark played all its frames, to get
+# out of the playback loop (which otherwise plays forever).
+class BenchmarkFinished(Exception):
+    pass
+
+
+# BenchScheduler
+#
+# FrameScheduler that also times the CPU the playback loop spent on each
+# frame, i.e. everything between returning from one nextFrame() and calling
+# the next, and stops the benchmark after numFrames frames.
+class BenchScheduler(frameScheduler.FrameScheduler):
+
+    def __init__(self, frameRate, numFrames, skipFrames=True):
+        super(BenchScheduler, self).__init__(frameRate, skipFrames)
+        self.numFrames = numFrames
+        self.framesPlayed = 0
+        # Per frame CPU time, in 10 microsecond buckets up to 10 ms
+        self.cpu = frameScheduler.LatenessStats(0.00001, 1000)
+        self.frameCpuStart = None
+
+    def start(self):
+        super(BenchScheduler, self).start()
+        self.frameCpuStart = time.thread_time()
+
+    def nextFrame(self):
+        self.cpu.record(time.thread_time() - self.frameCpuStart)
+        self.framesPlayed += 1
+        if self.framesPlayed >= self.numFrames:
+            raise BenchmarkFinished()
+        steps = super(BenchScheduler, self).nextFrame()
+        self.frameCpuStart = time.thread_time()
+        return steps
+
+
+# syntheticGestures(numServos, numGestures, numFrames, seed)
+#
+# A gesture library of smooth random motion: each servo of each gesture
+# follows a sine wave of its own amplitude, period and phase, so frames change
+# most servos a little like exported animation does.
+def syntheticGestures(numServos, numGestures, numFrames, seed=0):
+    generator = np.random.RandomState(seed)
+    frameNumbers = np.arange(numFrames, dtype=np.float64)[:, np.newaxis]
+    gestures = []
+    for gesture in range(numGestures):
+        center = generator.uniform(45, 135, numServos)
+        amplitude = generator.uniform(5, 45, numServos)
+        period = generator.uniform(numFrames / 2., numFrames * 2., numServos)
+        phase = generator.uniform(0, 2 * np.pi, numServos)
+        angles = center + amplitude * np.sin(2 * np.pi * frameNumbers / period + phase)
+        gestures.append(np.clip(np.rint(angles), 0, 180).astype(np.uint8))
+    return gestures
+
+
+# histogramSummary(stats, scale)
+#
+# The non-empty buckets of a LatenessStats histogram, as [upper bound, count]
+# pairs with the bounds multiplied by scale (e.g. 1000 for milliseconds).
+def histogramSummary(stats, scale):
+    return [[round((bucket + 1) * stats.bucketWidth * scale, 3), stats.histogram[bucket]]
+            for bucket in range(len(stats.histogram)) if stats.histogram[bucket] > 0]
+
+
+def statsSummary(stats, scale):
+    return {
+        "mean": round(stats.mean() * scale, 3),
+        "p50": round(stats.percentile(0.5) * scale, 3),
+        "p99": round(stats.percentile(0.99) * scale, 3),
+        "max": round(stats.max * scale, 3),
+        "histogram": histogramSummary(stats, scale),
+    }
+
+
+# runCase(case, options)
+#
+# Plays the synthetic library for one combination of servos, gestures, frames
+# and protocol, and returns its results.
+def runCase(case, options):
+    numServos, numGestures, numFrames, serialProtocol = case
+    random.seed(options.seed)
+    library = gestureLibrary.GestureLibrary(syntheticGestures(numServos, numGestures, numFrames, options.seed))
+
+    firmware = gestureSimulator.firmwareFromConfigs({
+        "numObjects": numServos,
+        "serialProtocol": serialProtocol,
+        "motorIdentification": options.motorIdentification,
+        "deltaUpdates": options.deltaUpdates,
+        "baudRate": options.baudRate,
+    })
+    serialPort = gestureSimulator.openSimulator(firmware, options.baudRate, options.latency)
+
+    # Set up the globals main() would from the configs
+    pythonGesturer.serialPort = serialPort
+    pythonGesturer.previousServoAngles = np.zeros(numServos, dtype=np.uint8)
+    pythonGesturer.changedServos = np.zeros(numServos, dtype=bool)
+    pythonGesturer.deltaUpdates = options.deltaUpdates
+    pythonGesturer.deltaBase = None
+    pythonGesturer.smoothingFrames = gestureSmoothing.transitionLength(options.smoothingDuration, options.frameRate)
+    pythonGesturer.smoothingEasing = options.smoothingEasing
+    pythonGesturer.newGesture = 0
+    pythonGesturer.currentBranch = pythonGesturer.newBranch = 0
+    pythonGesturer.transitionBool = False
+    pythonGesturer.windowedSender = None
+    if serialProtocol == gestureProtocol.WINDOWED_PROTOCOL:
+        pythonGesturer.windowedSender = gestureProtocol.WindowedSender(serialPort, options.windowSize,
+                                                                       options.ackTimeout, options.deltaUpdates)
+        pythonGesturer.windowedSender.start()
+
+    # Time every transition between gestures
+    smoothStats = frameScheduler.LatenessStats(0.001, 10000)
+    gestureSmooth = pythonGesturer.gestureSmooth
+
+    def timedGestureSmooth(*args):
+        startTime = time.monotonic()
+        gestureSmooth(*args)
+        smoothStats.record(time.monotonic() - startTime)
+    pythonGesturer.gestureSmooth = timedGestureSmooth
+
+    scheduler = BenchScheduler(options.frameRate, int(options.seconds * options.frameRate), options.skipLateFrames)
+    cpuStart = time.process_time()
+    # The playback loop reports every gesture switch, which is not what is
+    # being measured here
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler.start()
+        startTime = time.monotonic()
+        try:
+            pythonGesturer.playGestures(scheduler, numServos, library.lengths[0], 0, library,
+                                        options.motorIdentification, serialProtocol, None, 0)
+        except BenchmarkFinished:
+            pass
+        elapsed = time.monotonic() - startTime
+        cpuTime = time.process_time() - cpuStart
+        pythonGesturer.gestureSmooth = gestureSmooth
+        if pythonGesturer.windowedSender is not None:
+            pythonGesturer.windowedSender.stop()
+        else:
+            serialPort.close()
+
+    framesPlayed = scheduler.framesPlayed
+    return {
+        "servos": numServos,
+        "gestures": numGestures,
+        "frames": numFrames,
+        "protocol": serialProtocol,
+        "framesPlayed": framesPlayed,
+        "framesSkipped": scheduler.skippedFrames,
+        "framesReceived": firmware.frames,
+        # The benchmark stops as the last frame is due, so it ran for one
+        # frame period less than the frames played
+        "fps": round((framesPlayed - 1) / elapsed, 2),
+        "latenessMs": statsSummary(scheduler.lateness, 1000),
+        "bytesWrittenPerFrame": round(serialPort.bytesWritten / float(framesPlayed), 2),
+        "bytesReadPerFrame": round(serialPort.bytesRead / float(framesPlayed), 2),
+        "loopCpuPerFrameMs": statsSummary(scheduler.cpu, 1000),
+        "processCpuPerFrameMs": round(cpuTime / framesPlayed * 1000, 3),
+        "transitions": smoothStats.count,
+        "transitionMs": statsSummary(smoothStats, 1000),
+        "expectedTransitionMs": round(pythonGesturer.smoothingFrames * 1000. / options.frameRate, 3),
+    }
+
+
+def parseOptions():
+    parser = argparse.ArgumentParser(description="Benchmark pythonGesturer's playback loop against a simulated Arduino")
+    parser.add_argument("--servos", type=int, nargs="+", default=[2, 8])
+    parser.add_argument("--gestures", type=int, nargs="+", default=[4])
+    parser.add_argument("--frames", type=int, nargs="+", default=[48], help="frames per gesture")
+    parser.add_argument("--protocols", nargs="+", default=STREAMING_PROTOCOLS, choices=STREAMING_PROTOCOLS)
+    parser.add_argument("--motorIdentification", default="switching", choices=["switching", "addressing"])
+    parser.add_argument("--deltaUpdates", action="store_true")
+    parser.add_argument("--seconds", type=float, default=3., help="time to play each combination for")
+    parser.add_argument("--frameRate", type=float, default=24)
+    parser.add_argument("--baudRate", type=int, default=9600)
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds added to every reply")
+    parser.add_argument("--windowSize", type=int, default=4)
+    parser.add_argument("--ackTimeout", type=float, default=0.5)
+    parser.add_argument("--smoothingDuration", type=float, default=0.5)
+    parser.add_argument("--smoothingEasing", default="cosine", choices=sorted(gestureSmoothing.EASINGS))
+    parser.add_argument("--noSkipLateFrames", dest="skipLateFrames", action="store_false")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the JSON results to (defaults to printing them)")
+    return parser.parse_args()
+
+
+def main():
+    options = parseOptions()
+    cases = list(itertools.product(options.servos, options.gestures, options.frames, options.protocols))
+
+    results = []
+    for case in cases:
+        result = runCase(case, options)
+        print("%d servos, %d gestures x %d frames, %s: %.1f fps, lateness p99 %.2f ms, %.1f bytes per frame" %
+              (case + (result["fps"], result["latenessMs"]["p99"], result["bytesWrittenPerFrame"])),
+              file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(options),
+        "results": results,
+    }
+    if options.output is not None:
+        with open(options.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# cameraCapture.py
+#
+# Takes pictures for pythonGesturer without holding up the frame loop. The
+# loop only queues a request naming the picture; a capture thread grabs the
+# images from the camera and a pool of saver threads encodes and writes them,
+# each stage fed through a bounded queue. When capture falls behind, requests
+# are dropped instead of making the servos wait.
+#
+# Pictures are saved as a file each, named after the frame count and servo
+# angles, or appended to the shards of a datasetWriter.DatasetWriter. They can
+# be cropped to a region and scaled down first, so there is less to encode.
+
+import queue
+import threading
+
+import numpy as np
+
+import capturePolicy
+
+# pygame is only needed when pictures are taken, so playback works without it
+try:
+    import pygame
+    import pygame.camera
+except ImportError:
+    pygame = None
+
+
+# CameraCapture
+#
+# Call start() once, request(frameNumber, angles) for each picture to take and
+# stop() when done, which waits for the queued pictures to be saved.
+class CameraCapture(object):
+
+    def __init__(self, device="/dev/video0", resolution=(640, 480), numSavers=2, queueSize=8, dataset=None,
+                 region=None, scale=1., policy=None):
+        if pygame is None:
+            raise ImportError("pygame is needed to capture images, install it or set captureImages to False")
+        self.device = device
+        self.resolution = tuple(resolution)
+        self.numSavers = numSavers
+        self.dataset = dataset
+        # Region of the picture to keep as [x, y, width, height], and the
+        # size to scale it to
+        self.region = region
+        self.scale = scale
+        self.outputSize = capturePolicy.outputResolution(self.resolution, region, scale)
+        # Which frames to take pictures of, every frame by default
+        self.policy = policy if policy is not None else capturePolicy.CapturePolicy()
+        # Pictures waiting to be grabbed, and grabbed images waiting to be saved
+        self.requests = queue.Queue(queueSize)
+        self.images = queue.Queue(queueSize)
+        self.threads = []
+        self.camera = None
+        self.droppedImages = 0
+        self.savedImages = 0
+        # Pictures that could not be taken or saved, e.g. with the region
+        # outside the picture or the disk full
+        self.failedImages = 0
+        self.savedLock = threading.Lock()
+
+    def start(self):
+        pygame.init()
+        pygame.camera.init()
+        self.camera = pygame.camera.Camera(self.device, self.resolution)
+        self.camera.start()
+
+        self.threads = [threading.Thread(target=self.captureLoop)]
+        for i in range(self.numSavers):
+            self.threads.append(threading.Thread(target=self.saveLoop))
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    # request(frameNumber, angles)
+    #
+    # Asks for a picture to be taken now of the servos at the given angles,
+    # without blocking. Returns False if the capture policy skips the frame or
+    # the request was dropped because capture is behind.
+    def request(self, frameNumber, angles):
+        if not self.policy.shouldCapture(frameNumber, angles):
+            return False
+        try:
+            self.requests.put_nowait((frameNumber, np.array(angles, dtype=np.uint8)))
+            return True
+        except queue.Full:
+            self.droppedImages += 1
+            self.policy.cancel(angles)
+            return False
+
+    def captureLoop(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            try:
+                image = self.camera.get_image()
+            except Exception as error:
+                self.failed("take", item, error)
+                continue
+            self.images.put(item + (image,))
+        # Tell every saver to finish once the images before are saved
+        for i in range(self.numSavers):
+            self.images.put(None)
+
+    def saveLoop(self):
+        while True:
+            item = self.images.get()
+            if item is None:
+                break
+            frameNumber, angles, image = item
+            # A picture that fails to save must not stop this saver, or the
+            # pictures queued after it would never be saved and stop() would
+            # wait on them forever
+            try:
+                image = self.prepare(image)
+                if self.dataset is None:
+                    imageName = str(frameNumber) + "_" + "_".join(map(str, angles))
+                    pygame.image.save(image, imageName)
+                else:
+                    self.dataset.append(frameNumber, angles, pygame.image.tostring(image, self.dataset.pixelFormat))
+            except Exception as error:
+                self.failed("save", item, error)
+                continue
+            with self.savedLock:
+                self.savedImages += 1
+
+    # failed(action, item, error)
+    #
+    # Reports a picture that could not be taken or saved, and gives it back to
+    # the capture policy so its pose can be captured again.
+    def failed(self, action, item, error):
+        with self.savedLock:
+            self.failedImages += 1
+        self.policy.cancel(item[1])
+        print("Could not " + action + " the picture of frame " + str(item[0]) + ": " + str(error))
+
+    # prepare(image)
+    #
+    # Crops and scales a picture as configured.
+    def prepare(self, image):
+        if self.region is not None:
+            image = image.subsurface(pygame.Rect(self.region))
+        if self.scale != 1.:
+            image = pygame.transform.smoothscale(image, self.outputSize)
+        return image
+
+    def stop(self):
+        if self.camera is None:
+            return
+        self.requests.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.camera.stop()
+        self.camera = None
+        if self.dataset is not None:
+            self.dataset.close()
+        self.policy.save()
+
+    def report(self):
+        return ("Saved " + str(self.savedImages) + " images, skipped " + str(self.policy.skippedFrames) +
+                ", dropped " + str(self.droppedImages) + ", failed " + str(self.failedImages))
@@ -0,0 +1,149 @@
+# capturePolicy.py
+#
+# Decides which frames pythonGesturer takes a picture of, before anything is
+# asked of the camera. Frames can be decimated to every Nth frame, limited to
+# frames where the servos moved, or limited to poses that do not have enough
+# pictures yet (see PoseIndex).
+
+import os
+import threading
+
+import numpy as np
+
+
+# PoseIndex
+#
+# Counts how often each pose was played and how many pictures were taken of
+# it, with poses compared by their angles rounded down to resolution degrees.
+# Once a pose has samplesPerPose pictures, only every thinEvery-th time it is
+# played is captured (never, when thinEvery is 0). The counts are kept in
+# fileName across runs, so long collections stay balanced.
+class PoseIndex(object):
+
+    def __init__(self, resolution=1, samplesPerPose=1, thinEvery=0, fileName=None):
+        self.resolution = max(1, int(resolution))
+        self.samplesPerPose = samplesPerPose
+        self.thinEvery = thinEvery
+        self.fileName = fileName
+        # Times each pose was played and pictures taken of it, by the bytes
+        # of the rounded angles
+        self.hits = {}
+        self.samples = {}
+        # Pictures are given back from the capture threads (see cancel())
+        self.lock = threading.Lock()
+        if fileName is not None and os.path.exists(fileName):
+            self.load()
+
+    def key(self, angles):
+        return (np.asarray(angles, dtype=np.uint8) // self.resolution).tobytes()
+
+    def shouldCapture(self, angles):
+        pose = self.key(angles)
+        with self.lock:
+            hits = self.hits.get(pose, 0) + 1
+            self.hits[pose] = hits
+            samples = self.samples.get(pose, 0)
+
+            capture = samples < self.samplesPerPose
+            if not capture and self.thinEvery > 0:
+                capture = hits % self.thinEvery == 0
+            if capture:
+                self.samples[pose] = samples + 1
+        return capture
+
+    # cancel(angles)
+    #
+    # Takes back a picture shouldCapture() counted for the pose that was never
+    # taken or saved, so the pose is not left short of pictures.
+    def cancel(self, angles):
+        pose = self.key(angles)
+        with self.lock:
+            if self.samples.get(pose, 0) > 0:
+                self.samples[pose] -= 1
+
+    def load(self):
+        saved = np.load(self.fileName)
+        if int(saved["resolution"]) != self.resolution:
+            print("Pose index " + self.fileName + " was rounded to a different resolution, starting a new one")
+            return
+        for pose, hits, samples in zip(saved["poses"], saved["hits"], saved["samples"]):
+            self.hits[pose.tobytes()] = int(hits)
+            self.samples[pose.tobytes()] = int(samples)
+
+    # save()
+    #
+    # Writes the counts to fileName, replacing the old file only once the new
+    # one is complete.
+    def save(self):
+        if self.fileName is None or len(self.hits) == 0:
+            return
+        with self.lock:
+            poses = list(self.hits.keys())
+            hits = np.array([self.hits[pose] for pose in poses], dtype=np.uint32)
+            samples = np.array([self.samples.get(pose, 0) for pose in poses], dtype=np.uint32)
+        numServos = len(poses[0])
+        indexFile = open(self.fileName + ".tmp", "wb")
+        np.savez(indexFile, resolution=self.resolution,
+                 poses=np.frombuffer(b"".join(poses), dtype=np.uint8).reshape(len(poses), numServos),
+                 hits=hits, samples=samples)
+        indexFile.close()
+        os.replace(self.fileName + ".tmp", self.fileName)
+
+
+# CapturePolicy
+#
+# shouldCapture() is called once per frame with the angles just played.
+class CapturePolicy(object):
+
+    def __init__(self, everyNFrames=1, onChangeOnly=False, poseIndex=None):
+        self.everyNFrames = max(1, int(everyNFrames))
+        self.onChangeOnly = onChangeOnly
+        self.poseIndex = poseIndex
+        self.previousAngles = None
+        self.skippedFrames = 0
+
+    def shouldCapture(self, frameNumber, angles):
+        changed = self.previousAngles is None or (angles != self.previousAngles).any()
+        self.previousAngles = angles.copy()
+
+        capture = frameNumber % self.everyNFrames == 0
+        if capture and self.onChangeOnly:
+            capture = changed
+        if capture and self.poseIndex is not None:
+            capture = self.poseIndex.shouldCapture(angles)
+
+        if not capture:
+            self.skippedFrames += 1
+        return capture
+
+    # cancel(angles)
+    #
+    # Called when a picture shouldCapture() allowed was dropped or failed.
+    def cancel(self, angles):
+        if self.poseIndex is not None:
+            self.poseIndex.cancel(angles)
+
+    def save(self):
+        if self.poseIndex is not None:
+            self.poseIndex.save()
+
+
+# outputResolution(resolution, region, scale)
+#
+# Size of the pictures saved once cropped to region ([x, y, width, height],
+# or the whole picture) and scaled.
+def outputResolution(resolution, region=None, scale=1.):
+    if region is not None:
+        resolution = region[2:4]
+    return [max(1, int(round(resolution[0] * scale))), max(1, int(round(resolution[1] * scale)))]
+
+
+# policyFromConfigs(configs)
+#
+# The capture policy set in the YAML configs.
+def policyFromConfigs(configs):
+    poseIndex = None
+    if configs.get("captureDedupAngles", False):
+        poseIndex = PoseIndex(configs.get("captureDedupResolution", 1), configs.get("captureSamplesPerPose", 1),
+                              configs.get("captureThinEvery", 0), configs.get("poseIndexFile"))
+    return CapturePolicy(configs.get("captureEveryNFrames", 1), configs.get("captureOnChangeOnly", False), poseIndex)
@@ -0,0 +1,165 @@
+# datasetWriter.py
+#
+# Stores the pictures taken during playback as a dataset of a few large shard
+# files instead of a file per frame. Each shard holds the raw pixels of up to
+# framesPerShard images back to back, next to an index saved as a NumPy array
+# with the frame number, servo angles, byte offset and size of each image.
+# dataset.json in the directory lists the shards in order, so a training job
+# can stream through them sequentially (see iterateDataset). Writing into a
+# directory that already holds a dataset adds shards after the ones it has.
+
+import json
+import os
+import threading
+
+import numpy as np
+
+MANIFEST_NAME = "dataset.json"
+
+
+# DatasetError
+#
+# Raised when a directory holds a dataset the pictures can't be added to.
+class DatasetError(Exception):
+    pass
+
+
+# indexType(numServos)
+#
+# NumPy type of an entry in a shard's index.
+def indexType(numServos):
+    return np.dtype([("frame", "<u4"), ("offset", "<u8"), ("size", "<u4"), ("angles", "u1", (numServos,))])
+
+
+# DatasetWriter
+#
+# Appends images to the current shard, starting a new one when it is full.
+# append() can be called from several threads at once.
+class DatasetWriter(object):
+
+    def __init__(self, directory, numServos, resolution, framesPerShard=1000, prefix="frames", pixelFormat="RGB"):
+        self.directory = directory
+        self.numServos = numServos
+        self.resolution = list(resolution)
+        self.framesPerShard = framesPerShard
+        self.prefix = prefix
+        self.pixelFormat = pixelFormat
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Shards of earlier runs into this directory are kept
+        self.shards = self.loadShards()
+        self.shardNumber = None
+        self.shardFile = None
+        self.shardIndex = np.zeros(framesPerShard, dtype=indexType(numServos))
+        self.shardFrames = 0
+        self.shardSize = 0
+
+    def shardName(self, shardNumber):
+        return self.prefix + "_" + str(shardNumber).zfill(5)
+
+    # loadShards()
+    #
+    # The shards listed by the manifest already in the directory, if any,
+    # which must hold pictures of the same kind.
+    def loadShards(self):
+        manifestPath = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.exists(manifestPath):
+            return []
+        manifestFile = open(manifestPath)
+        manifest = json.load(manifestFile)
+        manifestFile.close()
+        if (manifest["numServos"] != self.numServos or manifest["resolution"] != self.resolution or
+                manifest["pixelFormat"] != self.pixelFormat):
+            raise DatasetError(self.directory + " holds pictures of " + str(manifest["numServos"]) + " servos at " +
+                               str(manifest["resolution"]) + " in " + manifest["pixelFormat"] +
+                               ", use another datasetDirectory for " + str(self.numServos) + " servos at " +
+                               str(self.resolution) + " in " + self.pixelFormat)
+        return manifest["shards"]
+
+    # nextShardNumber()
+    #
+    # Number of the next shard, after those in the manifest and skipping any
+    # files left behind by a run that stopped before finishing its shard.
+    def nextShardNumber(self):
+        shardNumber = len(self.shards)
+        while (os.path.exists(os.path.join(self.directory, self.shardName(shardNumber) + ".bin")) or
+               os.path.exists(os.path.join(self.directory, self.shardName(shardNumber) + ".idx.npy"))):
+            shardNumber += 1
+        return shardNumber
+
+    # append(frameNumber, angles, data)
+    #
+    # Adds the bytes of an image taken at the given frame with the servos at
+    # the given angles.
+    def append(self, frameNumber, angles, data):
+        with self.lock:
+            if self.shardFile is None:
+                self.shardNumber = self.nextShardNumber()
+                name = self.shardName(self.shardNumber)
+                self.shardFile = open(os.path.join(self.directory, name + ".bin"), "wb")
+            self.shardFile.write(data)
+
+            entry = self.shardIndex[self.shardFrames]
+            entry["frame"] = frameNumber
+            entry["offset"] = self.shardSize
+            entry["size"] = len(data)
+            entry["angles"] = angles
+            self.shardFrames += 1
+            self.shardSize += len(data)
+
+            if self.shardFrames == self.framesPerShard:
+                self.closeShard()
+
+    # closeShard()
+    #
+    # Finishes the current shard and writes its index, then adds it to the
+    # manifest so readers only ever see complete shards.
+    def closeShard(self):
+        if self.shardFile is None:
+            return
+        self.shardFile.close()
+        self.shardFile = None
+
+        name = self.shardName(self.shardNumber)
+        np.save(os.path.join(self.directory, name + ".idx.npy"), self.shardIndex[:self.shardFrames])
+        self.shards.append({"data": name + ".bin", "index": name + ".idx.npy", "frames": self.shardFrames})
+        self.shardFrames = 0
+        self.shardSize = 0
+        self.writeManifest()
+
+    def writeManifest(self):
+        manifest = {
+            "numServos": self.numServos,
+            "resolution": self.resolution,
+            "pixelFormat": self.pixelFormat,
+            "shards": self.shards,
+        }
+        manifestPath = os.path.join(self.directory, MANIFEST_NAME)
+        manifestFile = open(manifestPath + ".tmp", "w")
+        json.dump(manifest, manifestFile, indent=2)
+        manifestFile.close()
+        os.replace(manifestPath + ".tmp", manifestPath)
+
+    def close(self):
+        with self.lock:
+            self.closeShard()
+
+    def framesWritten(self):
+        return sum([shard["frames"] for shard in self.shards]) + self.shardFrames
+
+
+# iterateDataset(directory)
+#
+# Reads back a dataset shard by shard, yielding the frame number, servo
+# angles and image bytes of each picture in the order they were stored.
+def iterateDataset(directory):
+    manifest = json.load(open(os.path.join(directory, MANIFEST_NAME)))
+    for shard in manifest["shards"]:
+        index = np.load(os.path.join(directory, shard["index"]))
+        shardFile = open(os.path.join(directory, shard["data"]), "rb")
+        for entry in index:
+            shardFile.seek(int(entry["offset"]))
+            yield int(entry["frame"]), entry["angles"], shardFile.read(int(entry["size"]))
+        shardFile.close()
@@ -0,0 +1,108 @@
+# frameScheduler.py
+#
+# Paces the playback loop of pythonGesturer. Every frame has an absolute
+# deadline (frame N is due at t0 + N / frameRate on the monotonic clock), so
+# time spent sending frames or sleeping too long never adds up over a show.
+
+import time
+
+
+# LatenessStats
+#
+# Summary of how late frames started compared to their deadlines, with a
+# fixed size histogram so it stays small however long we play.
+class LatenessStats(object):
+
+    def __init__(self, bucketWidth=0.0001, numBuckets=1000):
+        self.bucketWidth = bucketWidth
+        self.maxBucket = numBuckets - 1
+        # Count of frames late by i bucket widths, the last bucket holds
+        # everything later than that
+        self.histogram = [0] * numBuckets
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self, lateness):
+        self.count += 1
+        self.total += lateness
+        self.max = max(self.max, lateness)
+        self.histogram[min(int(lateness / self.bucketWidth), self.maxBucket)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.
+
+    # percentile(fraction)
+    #
+    # Lateness in seconds that the given fraction of frames were within, to
+    # the bucket width.
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0.
+        threshold = fraction * self.count
+        seen = 0
+        for bucket in range(len(self.histogram)):
+            seen += self.histogram[bucket]
+            if seen >= threshold:
+                return min((bucket + 1) * self.bucketWidth, self.max)
+        return self.max
+
+
+# FrameScheduler
+#
+# Call start() right before the first frame is played, then nextFrame() after
+# each frame. When playback falls more than a frame behind, the frames that
+# are already overdue are skipped, so the next frame played is the one due now.
+class FrameScheduler(object):
+
+    def __init__(self, frameRate, skipFrames=True):
+        self.frameRate = frameRate
+        self.framePeriod = 1. / frameRate
+        self.skipFrames = skipFrames
+        self.startTime = None
+        self.frameNumber = 0
+        self.skippedFrames = 0
+        # Frames actually played, which leaves out the skipped ones
+        self.framesSent = 0
+        self.lateness = LatenessStats()
+
+    def start(self):
+        self.startTime = time.monotonic()
+        self.frameNumber = 0
+        self.framesSent = 1
+
+    def deadline(self, frameNumber):
+        return self.startTime + frameNumber * self.framePeriod
+
+    # nextFrame()
+    #
+    # Waits until the next frame is due and returns how many frames playback
+    # should advance by, which is more than 1 when frames were skipped.
+    def nextFrame(self):
+        self.frameNumber += 1
+        steps = 1
+        due = self.deadline(self.frameNumber)
+        now = time.monotonic()
+
+        if now < due:
+            time.sleep(due - now)
+            now = time.monotonic()
+        elif self.skipFrames:
+            # Coalesce every frame that is already overdue into this one
+            behind = int((now - due) / self.framePeriod)
+            if behind > 0:
+                self.frameNumber += behind
+                self.skippedFrames += behind
+                steps += behind
+                due = self.deadline(self.frameNumber)
+
+        self.lateness.record(now - due)
+        self.framesSent += 1
+        return steps
+
+    def report(self):
+        return ("Played " + str(self.framesSent) + " frames, skipped " + str(self.skippedFrames) +
+                ", lateness mean " + str(round(self.lateness.mean() * 1000, 2)) + " ms" +
+                ", p50 " + str(round(self.lateness.percentile(0.5) * 1000, 2)) + " ms" +
+                ", p99 " + str(round(self.lateness.percentile(0.99) * 1000, 2)) + " ms" +
+                ", max " + str(round(self.lateness.max * 1000, 2)) + " ms")
@@ -0,0 +1,101 @@
+# gestureData.py
+#
+# Loading of gesture animation data for pythonGesturer. Each gesture is held
+# as a contiguous uint8 NumPy array of frames x servos, already clamped to the
+# servo limits, so playback never has to parse or convert a value.
+
+import csv
+import mmap
+
+import numpy as np
+
+import gestureBinary
+
+
+# servoLimitArrays(numObjects, servoLimits)
+#
+# Lower and upper limit of each servo as arrays, from the [min, max] pairs in
+# the YAML configs (0 to 180 for servos without limits).
+def servoLimitArrays(numObjects, servoLimits=None):
+    lower = np.zeros(numObjects, dtype=np.int16)
+    upper = np.full(numObjects, 180, dtype=np.int16)
+    if servoLimits is not None:
+        for i in range(min(numObjects, len(servoLimits))):
+            lower[i] = max(0, int(servoLimits[i][0]))
+            upper[i] = min(180, int(servoLimits[i][1]))
+    return lower, upper
+
+
+# clampGesture(frames, lower, upper)
+#
+# Converts a frames x servos array of angles into a contiguous uint8 array
+# clamped to the servo limits.
+def clampGesture(frames, lower, upper):
+    clamped = np.clip(np.asarray(frames, dtype=np.int16), lower, upper)
+    return np.ascontiguousarray(clamped, dtype=np.uint8)
+
+
+# loadCsvGestures(fileName, numGestures, numObjects, servoLimits, delimiter)
+#
+# Reads the CSV output of the Blender addon, where each row is a timestep
+# followed by the angle of each servo and gestures are separated by rows
+# starting with the delimiter. Returns a list with an array per gesture.
+def loadCsvGestures(fileName, numGestures, numObjects, servoLimits=None, delimiter="*"):
+    lower, upper = servoLimitArrays(numObjects, servoLimits)
+
+    # Rows of each gesture, without the timestep column
+    gestureRows = [[] for gesture in range(numGestures)]
+    gestureCount = 0
+    csvInputFile = open(fileName, 'rt')
+    for row in csv.reader(csvInputFile):
+        if len(row) == 0:
+            continue
+        # If the first item in the CSV row is the delimiter, we have reached
+        # the end of a gesture
+        if row[0].strip() == delimiter:
+            gestureCount += 1
+            if gestureCount == numGestures:
+                break
+        else:
+            gestureRows[gestureCount].append(row[1:numObjects + 1])
+    csvInputFile.close()
+
+    gestures = []
+    for rows in gestureRows:
+        frames = np.array(rows, dtype=np.int16).reshape(len(rows), numObjects)
+        gestures.append(clampGesture(frames, lower, upper))
+    return gestures
+
+
+# loadBinaryGestures(fileName, numObjects, servoLimits)
+#
+# Memory maps a binary gesture library (see gestureBinary.py). The arrays are
+# read-only views into the mapping, so loading takes the same time for any
+# size of library and only the frames of gestures actually played are read
+# from disk. Returns the list of arrays and the gesture names.
+def loadBinaryGestures(fileName, numObjects, servoLimits=None):
+    gestureFile = open(fileName, "rb")
+    gestureMap = mmap.mmap(gestureFile.fileno(), 0, access=mmap.ACCESS_READ)
+    gestureFile.close()
+
+    numServos, fileLimits, index = gestureBinary.readGestureIndex(gestureMap)
+    if numServos != numObjects:
+        raise gestureBinary.GestureFileError(fileName + " has " + str(numServos) + " servos, expected " + str(numObjects))
+
+    # Angles were clamped when the file was written, so only clamp again if
+    # the limits have changed since
+    lower, upper = servoLimitArrays(numObjects, servoLimits)
+    reclamp = fileLimits != [[int(lower[i]), int(upper[i])] for i in range(numObjects)]
+    if reclamp:
+        print("Servo limits differ from those in " + fileName + ", clamping all gestures")
+
+    gestures = []
+    names = []
+    for name, offset, numFrames in index:
+        frames = np.frombuffer(gestureMap, dtype=np.uint8, count=numFrames * numServos, offset=offset)
+        frames = frames.reshape(numFrames, numServos)
+        if reclamp:
+            frames = clampGesture(frames, lower, upper)
+        gestures.append(frames)
+        names.append(name)
+    return gestures, names
@@ -0,0 +1,136 @@
+# gestureLibrary.py
+#
+# Index over the loaded gestures for pythonGesturer. Everything the switching
+# logic asks about a gesture (its frames, name, branch, which gesture moves
+# between two branches) is worked out once at load and kept in dicts, so the
+# frame loop never has to search through the gesture lists.
+
+from collections import deque
+
+import gestureBinary
+
+
+# GestureLibrary
+#
+# Gestures are identified by their position in the gesture file (0, 1, ...),
+# and transition gestures played backwards by negative ids: the backwards
+# version of the k-th gesture in transitionList is -(k + 1).
+class GestureLibrary(object):
+
+    # __init__(gestures, names, gestureGroupList, transitionList, transitionGestures)
+    #
+    # gestures is the list of frames x servos arrays in file order, and the
+    # rest describe the branches as in pythonGesturer (gestureGroupList holds
+    # the gestures of each branch, transitionGestures holds [from branch, to
+    # branch, gesture] for each transition gesture in transitionList).
+    def __init__(self, gestures, names=None, gestureGroupList=None, transitionList=None, transitionGestures=None):
+        # Gestures without a name in the configs get a default one
+        defaultNames = gestureBinary.defaultGestureNames(len(gestures))
+        names = list(names or []) + defaultNames[len(names or []):]
+        gestureGroupList = gestureGroupList or [list(range(len(gestures)))]
+        transitionList = transitionList or []
+        transitionGestures = transitionGestures or []
+
+        # Frames, length and name of each gesture by id
+        self.frames = {}
+        self.lengths = {}
+        self.names = {}
+        # Id of each gesture by name
+        self.ids = {}
+        for gestureId in range(len(gestures)):
+            self.add(gestureId, names[gestureId], gestures[gestureId])
+
+        # Transition gestures played backwards, as views of the forward frames
+        self.backwardIds = {}
+        for k in range(len(transitionList)):
+            forwardId = transitionList[k]
+            self.backwardIds[forwardId] = -(k + 1)
+            self.add(-(k + 1), self.names[forwardId] + "_reversed", self.frames[forwardId][::-1])
+
+        # Branch of each gesture and gestures of each branch
+        self.branches = {}
+        self.branchGestures = {}
+        for branch in range(len(gestureGroupList)):
+            self.branchGestures[branch] = list(gestureGroupList[branch])
+            for gestureId in gestureGroupList[branch]:
+                self.branches[gestureId] = branch
+
+        # Gestures that can be chosen to play, i.e. everything but transitions
+        self.playable = [gestureId for branch in range(len(gestureGroupList))
+                         for gestureId in gestureGroupList[branch] if gestureId not in transitionList]
+
+        # Gesture to play when moving from one branch to another, each
+        # transition gesture is played forwards one way and backwards the other
+        self.transitions = {}
+        for fromBranch, toBranch, gestureId in transitionGestures:
+            if gestureId not in self.backwardIds:
+                raise ValueError("Transition gesture " + str(gestureId) + " is not in transitionList")
+            self.transitions[(fromBranch, toBranch)] = gestureId
+            self.transitions.setdefault((toBranch, fromBranch), self.backwardIds[gestureId])
+
+        # Shortest chain of transition gestures between every pair of branches
+        self.routes = self.shortestRoutes(list(self.branchGestures.keys()))
+
+    def add(self, gestureId, name, frames):
+        self.frames[gestureId] = frames
+        self.lengths[gestureId] = len(frames)
+        self.names[gestureId] = name
+        self.ids[name] = gestureId
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, gestureId):
+        return gestureId in self.frames
+
+    # byName(name)
+    #
+    # Frames of the gesture with the given name.
+    def byName(self, name):
+        return self.frames[self.ids[name]]
+
+    # branch(gestureId)
+    #
+    # Branch the gesture is on, or None for gestures outside any branch.
+    def branch(self, gestureId):
+        return self.branches.get(gestureId)
+
+    # transition(fromBranch, toBranch)
+    #
+    # Id of the gesture that moves directly from one branch to the other, or
+    # None when there is no transition gesture between them.
+    def transition(self, fromBranch, toBranch):
+        return self.transitions.get((fromBranch, toBranch))
+
+    # route(fromBranch, toBranch)
+    #
+    # Transition gestures to play in order to get from one branch to the
+    # other, through as few branches as possible. Empty when the branches are
+    # the same or not connected by transition gestures.
+    def route(self, fromBranch, toBranch):
+        return self.routes.get((fromBranch, toBranch), ())
+
+    # shortestRoutes(branches)
+    #
+    # Breadth first search from every branch over the graph where each
+    # transition gesture (forwards or backwards) is an edge between branches.
+    def shortestRoutes(self, branches):
+        neighbours = dict((branch, []) for branch in branches)
+        for (fromBranch, toBranch), gestureId in sorted(self.transitions.items()):
+            neighbours.setdefault(fromBranch, []).append((toBranch, gestureId))
+            neighbours.setdefault(toBranch, [])
+
+        routes = {}
+        for start in neighbours:
+            paths = {start: ()}
+            queue = deque([start])
+            while queue:
+                branch = queue.popleft()
+                for nextBranch, gestureId in neighbours[branch]:
+                    if nextBranch not in paths:
+                        paths[nextBranch] = paths[branch] + (gestureId,)
+                        queue.append(nextBranch)
+            for end in paths:
+                if end != start:
+                    routes[(start, end)] = paths[end]
+        return routes
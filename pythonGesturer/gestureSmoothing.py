@@ -0,0 +1,54 @@
+# gestureSmoothing.py
+#
+# Cross-fades between gestures for pythonGesturer. A transition is computed
+# up front as a frames x servos trajectory, moving every servo from its start
+# to its end angle over the same number of frames along an easing curve, and
+# is then played like any other gesture.
+
+import numpy as np
+
+
+# Easing curves, each mapping the fraction of the transition's time that has
+# passed (0 to 1) to the fraction of the distance to move by then
+
+def linearEasing(t):
+    return t
+
+
+def cosineEasing(t):
+    return (1. - np.cos(np.pi * t)) / 2.
+
+
+# Minimum jerk profile, which starts and ends with zero velocity and
+# acceleration
+def minimumJerkEasing(t):
+    return t * t * t * (10. - 15. * t + 6. * t * t)
+
+
+EASINGS = {
+    "linear": linearEasing,
+    "cosine": cosineEasing,
+    "minimumJerk": minimumJerkEasing,
+}
+
+
+# transitionLength(duration, frameRate)
+#
+# Number of frames a transition of the given duration in seconds takes.
+def transitionLength(duration, frameRate):
+    return max(1, int(round(duration * frameRate)))
+
+
+# crossFade(startAngles, endAngles, numFrames, easing)
+#
+# Trajectory from the start to the end angles as a uint8 array of numFrames
+# frames, not including the start angles but ending on the end angles.
+def crossFade(startAngles, endAngles, numFrames, easing="cosine"):
+    if easing not in EASINGS:
+        raise ValueError("Unknown easing " + str(easing) + ", expected one of " + ", ".join(sorted(EASINGS)))
+    start = np.asarray(startAngles, dtype=np.float64)
+    end = np.asarray(endAngles, dtype=np.float64)
+
+    progress = EASINGS[easing](np.arange(1, numFrames + 1, dtype=np.float64) / numFrames)
+    trajectory = start + np.outer(progress, end - start)
+    return np.rint(trajectory).astype(np.uint8)
@@ -5,26 +5,34 @@
 # CSV files.
 # 
 #!/usr/bin/python
-import csv
-import pygame
+import inspect
+import os
 import serial
-import struct
 import sys
 import time
-import yaml
 import random
 import numpy as np
 from random import randint
 
+# Make the serial protocol shared with the Blender addon available for import
+currentDirectory = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+sys.path.append(os.path.join(currentDirectory, "../blenderGestureAddon/addon-gestureDeveloper/"))
+import gestureProtocol
+import gesturerConfigs
+import servoMap
+
+import frameScheduler
+import gestureData
+import gestureLibrary
+import gestureSmoothing
+
 # Import needed for camera ######################################################
-# make sure to install pygame in order for the import to work
-import pygame
-import pygame.camera 
-from pygame.locals import *
+# pygame is imported by cameraCapture, and only needed with captureImages set
+import cameraCapture
+import datasetWriter
+import capturePolicy
 #################################################################################
 
-import copy
-
 
 ###################### Implementation Specific Definitions #####################
 frameCounter = 0
@@ -34,8 +42,9 @@ frameCounter = 0
 # Global Variables
 
 # Array to store previous servo angles, so we know when to send new values to
-# the servos
+# the servos, and a buffer for which of them changed
 previousServoAngles = []
+changedServos = []
 
 # Value to represent the new gesture to be performed, when this value is 
 # changed in updateGesture() the program smooths between the current gesture
@@ -50,6 +59,20 @@ globalTimeout = None
 # connected to a hardware port (read in from configs)
 serialPort = serial.Serial(None, 9600, timeout = globalTimeout)
 
+# Sender keeping several frames in flight, only used with the "windowed" 
+# serial protocol (created once the serial port is open)
+windowedSender = None
+
+# Whether frames only carry the servos that changed (read in from configs), and
+# the last angles confirmed by the Arduino that those changes are taken from
+deltaUpdates = False
+deltaBase = None
+
+# Number of frames and easing curve of the cross-fade between gestures (read 
+# in from configs)
+smoothingFrames = 12
+smoothingEasing = "cosine"
+
 # The user will input the total number of gestures
 totalGestures = 0
 
@@ -65,8 +88,9 @@ transitionBool = False
 # a variable for storing in the next gesture when transition occurs 
 nextGesture = 0
 
-# a variable to store file name for pictures taken by the camera
-imageName = ""
+# transition gestures still to play after the current one, when getting to
+# the new branch takes a chain of them
+transitionQueue = []
 
 ###################### Implementation Specific Functions #######################
 
@@ -80,7 +104,6 @@ Ex) [[0],[2],[4]]
 Make sure to not include the transition gesture as part of branch gesture
 """
 gestureGroupList = [[0,1,2]]
-npGesture = np.array(gestureGroupList)
 
 """
 List of transition gestures
@@ -97,19 +120,15 @@ Ex) [[0,1,1],[1,2,3],[2,0,5]]
 """
 transitionGestures = []
 
-# list of nontransition gestures - automatically generated
-l1 = npGesture.flatten()
-l3 = [x for x in list(l1) if x not in transitionList]
-
-# Simple example of changing the newGesture to a constant value
-def updateGesture(frame, csvGestureData, csvGestureLength):
+# Simple example of changing the newGesture to a constant value, the library
+# knows which gestures can be chosen and the branch of each. skippedFrames is
+# how many frames before this one were skipped for running late, so a change
+# due on one of them still happens
+def updateGesture(frame, library, skippedFrames=0):
     global newGesture
     global frameCounter
-    global gestureGroupList
-    global transitionGestures
     global newBranch
     global transitionBool
-    global l3
     global currentBranch
 
     chosen = False
@@ -121,142 +140,76 @@ def updateGesture(frame, csvGestureData, csvGestureLength):
     totalGestures = 6
 
     # Choose between user input random gestures
-    if frame == changeGestureFrame and transitionBool == False:
-        newGesture = random.choice(l3)
+    if frame - skippedFrames <= changeGestureFrame <= frame and transitionBool == False:
+        newGesture = random.choice(library.playable)
         print ("Current branch is: " + str(currentBranch))
         # see which branch the new gesture belongs to and update accordingly
-        counter = 0
-        for sub_list in gestureGroupList:
-            for j in sub_list:
-                if j == newGesture:
-                    newBranch = counter
-                    print ("Future branch is: " + str(newBranch))
-            counter += 1
+        if library.branch(newGesture) is not None:
+            newBranch = library.branch(newGesture)
+            print ("Future branch is: " + str(newBranch))
 
 
 ################################################################################
 
 
-def gestureSmooth(sleepTime, numObjects, startPosArray, endPosArray):
+# Send a frame of servo angles to the Arduino with the configured protocol,
+# returning whether it was delivered
+def sendAngles(angles, motorIdentification, serialProtocol):
+    global deltaBase
+
+    if serialProtocol == gestureProtocol.WINDOWED_PROTOCOL:
+        return windowedSender.send(angles)
+
+    changed = None
+    if deltaUpdates:
+        changed = gestureProtocol.deltaMask(angles, deltaBase)
+    delivered = gestureProtocol.sendFrame(serialPort, angles, serialProtocol, motorIdentification, changed)
+    # Only angles the Arduino confirmed can be the base for the next changes
+    deltaBase = list(angles) if delivered else None
+    return delivered
+
+
+# Cross-fade from the start to the end positions over smoothingFrames frames,
+# streamed through the scheduler so every step is a single frame sent on its
+# deadline. Returns when the end positions are due, for the caller to play
+def gestureSmooth(scheduler, numObjects, startPosArray, endPosArray, motorIdentification, serialProtocol):
     print("Smoothing between gestures...")
 
-    # Right now position arrays start as strings, so convert them to integers
-    startPosArray = map(int, startPosArray)
-    endPosArray = map(int, endPosArray)
-
-    # Find the maximum distance between positions for the start and end positions
-    # of each object
-    maxDelta = 0
-    for i in range(numObjects):
-        testDelta = abs(startPosArray[i + 1] - endPosArray[i + 1])
-        if maxDelta < testDelta:
-            maxDelta = testDelta
-
-    # Setup temporary buffer for transitionary positions
-    servoValues = [0] * numObjects
-    # Initialize the temporary buffer with the starting positions
-    for i in range(numObjects):
-        servoValues[i] = startPosArray[i + 1]
-
-    startTime = time.time()
-    endTime = time.time()
-
-    # Linear smoothing over the range of the longest distance
-    for i in range(maxDelta):
-        startTime = time.time()
-
-        # For each object
-        for i in range(numObjects):
-            # Linearly increment/decrement the servo value towards the end 
-            # position value, how/if appropriate
-            if servoValues[i] > endPosArray[i + 1]:
-                servoValues[i] -= 1
-            elif servoValues[i] < endPosArray[i + 1]:
-                servoValues[i] += 1
-            # Otherwise, the servo value is the end position value, and that 
-            # servo stops animating
-
-            # print("Servo value is: " + str(servoValues[i]))
-            # Write out the servo value to the Arduino and read back the return
-            serialPort.write(struct.pack('B', servoValues[i]))
-            serialRead = serialPort.read()
-
-        endTime = time.time()
-        timeDifference = endTime - startTime
-
-        # If rendering the frame on the robot took less time than the sleep
-        # time, subtract the timeDifference from the sleepTime and sleep 
-        # that amount to create the proper frame rate
-        if 0 < timeDifference and timeDifference < sleepTime:
-            time.sleep(sleepTime - timeDifference)
-        else:
-            print("Execution time exceeded the frame rate...")
-        # Otherwise, we do not want to sleep as we have already spent more
-        # time than the frame rate   
+    # Every servo moves along the easing curve at once, the last frame of the
+    # trajectory is the end position
+    trajectory = gestureSmoothing.crossFade(startPosArray, endPosArray, smoothingFrames, smoothingEasing)
 
+    # Frames of the trajectory that are overdue are skipped like any other
+    framesPlayed = 0
+    while True:
+        framesPlayed += scheduler.nextFrame()
+        if framesPlayed >= len(trajectory):
+            break
+        frame_handler(framesPlayed - 1, numObjects, trajectory, motorIdentification, serialProtocol)
 
-def frame_handler(scene, numObjects, csvFile, motorIdentification):
-    # Create an array to store the angles we get from the Blender scene, and a
-    # bool to see if we should send these values to the Arduino
-    newAngles = [0] * numObjects
-    shouldResend = False
 
+def frame_handler(scene, numObjects, gestureFrames, motorIdentification, serialProtocol):
     # We will be modifying this global variable, so we declare it global
     global previousServoAngles
 
-    # main function will use the name to store the picture
-    global imageName
-
-    # Generalized loop for putting an arbitrary number of object parameters out 
-    # on the serial connection
-    for i in range(numObjects):
-        # We index plus 1 into the csvFile since there is timestep data
-        servoAngle = int(csvFile[scene][i + 1])
-        if (servoAngle > 180):
-            servoAngle = 180
-        elif (servoAngle < 0):
-            servoAngle = 0
-        newAngles[i] = servoAngle
-        # print("Servo " + str(i) + "is: " + str(servoAngle))
-
-        # If the angle of a motor has changed, rewrite them all to Arduino
-        if servoAngle != previousServoAngles[i]:
-            shouldResend = True
-
-            previousServoAngles[i] = newAngles[i]
-
-        # Variable needed for camera ###############################################
-        # generate the file name for the picture
-        imageName = '_'.join(map(str,newAngles))
-        ############################################################################
-
-    # If we should resend the motor positons, loop through and send each based
-    # on the motor identification scheme (addressing/switching)
+    # The angles were parsed and clamped to the servo limits when loaded, so
+    # the frame is just a row of the gesture
+    newAngles = gestureFrames[scene]
+
+    # If the angle of any motor has changed, rewrite them to the Arduino
+    np.not_equal(newAngles, previousServoAngles, out=changedServos)
+    shouldResend = changedServos.any()
+    previousServoAngles[:] = newAngles
+
+    # If we should resend the motor positons, send the whole frame with the
+    # configured protocol (packet, or echo with addressing/switching)
     if shouldResend == True:
-        for i in range(numObjects):
-            # If we are addressing motors, first send "i"
-            if motorIdentification == "addressing":
-                serialPort.write(struct.pack('B', (181 + i)))
-                serialRead = serialPort.read()
-                # Make sure the value read by Arduino and returned is the same as 
-                # that we sent, otherwise exit the program
-                if ord(serialRead) != (181 + i):
-                    sys.exit()
-                    print("Serial send not equal to serial return")
-                    break
-
-            serialPort.write(struct.pack('B', newAngles[i]))
-            # previousServoAngles[i] = newAngles[i]
-            # print("Write angle " + str(i) + " is: " + str(newAngles[i]))
-
-            serialRead = serialPort.read()
-            # Make sure the value read by Arduino and returned is the same as 
-            # that we sent, otherwise exit the program
-            if ord(serialRead) != newAngles[i]:
-                sys.exit()
-                print("Serial send not equal to serial return")
-                break
-        shouldResend = False
+        # Make sure the values read by Arduino and returned are the same as 
+        # those we sent, otherwise exit the program (the windowed protocol
+        # recovers from mismatches itself, and only fails if the port is lost)
+        if not sendAngles(newAngles, motorIdentification, serialProtocol):
+            print("Serial send not equal to serial return")
+            sys.exit()
 
 
 def main():
@@ -269,38 +222,32 @@ def main():
     global nextGesture
     global gestureGroupList
     global backwards
-
-    # initialize the camera ###################################################################
-    global imageName
-    pygame.init()
-    pygame.camera.init()
-    cam = pygame.camera.Camera("/dev/video0", (640,480))
-    cam.start()
-    ###########################################################################################
-
-    # Read in the YAML configs
-    fileName = "gesturerConfigs.yaml"
-    fileStream = open(fileName).read()
+    global serialPort
+    global windowedSender
+    global deltaUpdates
+    global changedServos
+    global smoothingFrames
+    global smoothingEasing
 
     switchNum = 400
     currentGesture = 0
-    # find which branch currentGesture is in
-    counter = 0
-    for sub_list in gestureGroupList:
-        for j in sub_list:
-            if j == newGesture:
-                currentBranch = counter
-        counter += 1
     switchCount = 0
 
-    configs = yaml.load(fileStream, Loader=yaml.Loader)
+    # Read in the YAML configs, cached after the first time they are parsed
+    configs = gesturerConfigs.loadConfigs("gesturerConfigs.yaml")
     # Load the YAML configs into global variables for easy access
     numObjects = configs["numObjects"]
+    # The limits of each servo, from the servo map shared with the addon
+    servos = servoMap.ServoMap.fromConfigs(configs)
     numGestures = configs["numGestures"]
     motorIdentification = configs["motorIdentification"]
-    previousServoAngles = [0] * numObjects
+    # Older configs predate the packet protocol, so default to the echo scheme
+    serialProtocol = configs.get("serialProtocol", "echo")
+    deltaUpdates = configs.get("deltaUpdates", False)
+    previousServoAngles = np.zeros(numObjects, dtype=np.uint8)
+    changedServos = np.zeros(numObjects, dtype=bool)
 
-    serialPort.port = configs["serialPort"]
+    serialPort = gestureProtocol.serialPortFor(configs["serialPort"], configs.get("baudRate", 9600), globalTimeout)
 
     # TODO: Read in a single CSV file (name in the YAML). DONE
     # TODO: Calculate indexing into the CSV for each individual gesture, make
@@ -309,92 +256,134 @@ def main():
 
     csvOutputName = configs["csvOutputName"]
 
-    # Read in the gesture csv files
-    csvInputFile = open(csvOutputName, 'rt')
-    reader = csv.reader(csvInputFile)
-    row_count = 0
-    # Will be a list of gesture number lists, each containing a list of the 
-    # positions for each motor at each frame of the gesture
-    csvGestureData = []
-    for gesture in range(numGestures):
-        # Append a new list for each gesture, if we multiply an empty list it is
-        # three references to the same list!
-        csvGestureData.append([])
-    csvGestureLength = [0] * numGestures
-
-    # TODO: For each gesture, create a new entry in csvGestureData and populate
-    # it with csv values (by appending). DONE
-    gestureCount = 0
-    # Read through the CSV file and populate the gesture data/length arrays 
-    for row in reader:
-        # If the first item in the CSV row is a "*", we have reached the end of
-        # a gesture
-        if row[0] == "*":
-            csvGestureLength[gestureCount] = len(csvGestureData[gestureCount])
-            gestureCount += 1
-        # Otherwise, continue adding to the current gesture
-        else:
-            csvGestureData[gestureCount].append(row)
-
-    # In case there was no "*" at the end of the last gesture, we set the last 
-    # gesture length
-    if gestureCount == (numGestures - 1):
-        csvGestureLength[gestureCount] = len(csvGestureData[gestureCount])
-
-    # Close the CSV input file
-    csvInputFile.close()
-
-    # TODO: Append the Backward gestures in reverse order to the back of gestures
-    # So that first transition gesture backwards can be called with -1
-    for i in transitionList[::-1]:
-        # get the transition gesture to be reversed
-        tempGesture = copy.deepcopy(csvGestureData[i])
-        # reverse the transition gesture
-        tempGesture.reverse()
-        for i in range(len(csvGestureData)):
-            tempGesture[i][0] = str(i)
-        # append the transition gesture to the end of the gesture data
-        csvGestureData.append(tempGesture)
-        # update csvGestureLength
-        csvGestureLength.append(len(csvGestureData[-1]))
+    # Read in the gestures, each gesture becomes a frames x servos array with
+    # the angles clamped to the servo limits. A binary gesture library is 
+    # memory mapped when there is one, otherwise the csv file is parsed. A
+    # binary library older than the csv file is out of date, since the addon
+    # can export the csv file alone
+    binaryOutputName = configs.get("binaryOutputName")
+    useBinary = binaryOutputName is not None and os.path.exists(binaryOutputName)
+    if useBinary and os.path.exists(csvOutputName) and os.path.getmtime(csvOutputName) > os.path.getmtime(binaryOutputName):
+        print("Ignoring " + binaryOutputName + ", " + csvOutputName + " was exported after it")
+        useBinary = False
+    if useBinary:
+        print("Loading gestures from " + binaryOutputName)
+        csvGestureData, gestureNames = gestureData.loadBinaryGestures(binaryOutputName, numObjects, servos.limits)
+        csvGestureData = csvGestureData[:numGestures]
+        gestureNames = gestureNames[:numGestures]
+    else:
+        print("Loading gestures from " + csvOutputName)
+        csvGestureData = gestureData.loadCsvGestures(csvOutputName, numGestures, numObjects,
+                                                     servos.limits, configs.get("gestureDelimiter", "*"))
+        gestureNames = configs.get("gestureNames")
+
+    # Index the gestures by id, name and branch, the backwards transition 
+    # gestures are given negative ids so the first can be called with -1
+    library = gestureLibrary.GestureLibrary(csvGestureData, gestureNames, gestureGroupList,
+                                            transitionList, transitionGestures)
+    # The Arduino plays gestures from flash by numbers of its own, which must
+    # cover every transition gesture, backwards ones included
+    if serialProtocol == gestureProtocol.PLAYBACK_PROTOCOL:
+        flashIds = storedGestureIds(library, numGestures, configs.get("playbackReversedGestures", []))
+    # find which branch currentGesture is in
+    if library.branch(currentGesture) is not None:
+        currentBranch = library.branch(currentGesture)
 
     # Start the number of frames as the length of the currentGesture
-    numFrames = csvGestureLength[currentGesture]
+    numFrames = library.lengths[currentGesture]
 
     serialPort.open()
     # Connecting time for Arduino
     time.sleep(3)
 
-    # Set frame rate and corresponding sleep rate
-    # TODO: import these from the YAML configs and have them be set by the user
-    # to correspond with how the gesture was generated (in Blender or otherwise)
-    frameRate = 24
-    sleepTime = 1./frameRate
-    # absoluteSleepTime = 1./frameRate
+    # Step up to the fastest baud rate both sides can communicate at
+    if configs.get("negotiateBaudRate", False):
+        baudRate = gestureProtocol.negotiateBaudRate(serialPort, configs.get("baudRates", []))
+        print("Communicating at " + str(baudRate) + " baud")
+
+    # Acknowledgements for the windowed protocol are matched on a reader thread
+    if serialProtocol == gestureProtocol.WINDOWED_PROTOCOL:
+        windowedSender = gestureProtocol.WindowedSender(serialPort, configs.get("windowSize", 4), configs.get("ackTimeout", 0.5), deltaUpdates)
+        windowedSender.start()
+
+    # Set frame rate and corresponding sleep rate, the frame rate should
+    # correspond with how the gesture was generated (in Blender or otherwise)
+    frameRate = configs.get("frameRate", 24)
+    # Transitions between gestures take the same time however far the servos
+    # have to move
+    smoothingFrames = gestureSmoothing.transitionLength(configs.get("smoothingDuration", 0.5), frameRate)
+    smoothingEasing = configs.get("smoothingEasing", "cosine")
+    # Frames are paced against absolute deadlines, so lateness never adds up
+    scheduler = frameScheduler.FrameScheduler(frameRate, configs.get("skipLateFrames", True))
 
     # Main loop for executing gestures/the logic for switching between them
     # TODO: Add modular logic for switching between gestures. MOSTLY DONE (just 
     # need to write an example updateGesture())
 
-    startTime = time.time()
-    endTime = time.time()
-
     # Variable for Camera #######################################################################
     # counter for recording images
     counter = 0
+    # Pictures are taken on a thread of their own and saved by a pool of 
+    # savers, so the frame loop never waits on the camera or the disk
+    capture = None
+    # Gestures played from flash never pass through here a frame at a time
+    if configs.get("captureImages", True) and serialProtocol != gestureProtocol.PLAYBACK_PROTOCOL:
+        # Pictures can be cropped to captureRegion and scaled by captureScale
+        # before they are encoded
+        cameraResolution = configs.get("cameraResolution", [640, 480])
+        captureRegion = configs.get("captureRegion")
+        captureScale = configs.get("captureScale", 1.)
+        # Either a file per picture, or shards of a dataset in datasetDirectory
+        dataset = None
+        if configs.get("datasetDirectory") is not None:
+            dataset = datasetWriter.DatasetWriter(configs["datasetDirectory"], numObjects,
+                                                  capturePolicy.outputResolution(cameraResolution, captureRegion, captureScale),
+                                                  configs.get("framesPerShard", 1000))
+        capture = cameraCapture.CameraCapture(configs.get("cameraDevice", "/dev/video0"), cameraResolution,
+                                              configs.get("captureSavers", 2), configs.get("captureQueueSize", 8), dataset,
+                                              captureRegion, captureScale, capturePolicy.policyFromConfigs(configs))
+        capture.start()
     #############################################################################################
 
+    scheduler.start()
+    try:
+        if serialProtocol == gestureProtocol.PLAYBACK_PROTOCOL:
+            playStoredGestures(currentGesture, library, frameRate, flashIds)
+        else:
+            playGestures(scheduler, numObjects, numFrames, currentGesture, library, motorIdentification, serialProtocol, capture, counter)
+    finally:
+        print(scheduler.report())
+        # Settle the frames still in flight before the port is closed
+        if windowedSender is not None:
+            if not windowedSender.stop():
+                print("Stopped before every frame in flight was acknowledged")
+            print(windowedSender.report())
+        if capture is not None:
+            capture.stop()
+            print(capture.report())
+
+
+def playGestures(scheduler, numObjects, numFrames, currentGesture, library, motorIdentification,
+                 serialProtocol, capture, counter):
+    global newGesture
+    global currentBranch
+    global newBranch
+    global transitionBool
+    global nextGesture
+    global transitionQueue
+
     while True:
-        for currentFrame in range(numFrames):
-            startTime = time.time()
-            
-            frame_handler(currentFrame, numObjects, csvGestureData[currentGesture],  motorIdentification)
+        currentFrame = 0
+        # Frames skipped right before currentFrame
+        skippedFrames = 0
+        while currentFrame < numFrames:
+            frame_handler(currentFrame, numObjects, library.frames[currentGesture], motorIdentification, serialProtocol)
             # Save image from Camera ####################################################################
-            # save the image
-            imageName = str(counter) + "_" + imageName
-            image = cam.get_image()
-            pygame.image.save(image, imageName)
-            counter += 1
+            # queue the image to be taken and saved, tagged with the frame count
+            # and servo angles, if the capture policy wants this frame
+            if capture is not None:
+                capture.request(counter, previousServoAngles)
+                counter += 1
             #############################################################################################
 
             # Sleep to create a frame rate
@@ -410,7 +399,7 @@ def main():
             # LOGIC FOR SWITCHING "currentGesture" GOES HERE
             # it will not do anything if the gesture is a transition gesture
             if not transitionBool:
-                updateGesture(currentFrame, csvGestureData, csvGestureLength)
+                updateGesture(currentFrame, library, skippedFrames)
 
 
             # if the new gestures is not the current gesture,
@@ -422,28 +411,20 @@ def main():
             ############ TRANSITION ###################################################
                 # check if the two gestures are of different branches
                 if currentBranch != newBranch:
-                    print "Different Branches"
-                    # if they are not on the same branch, do a transition gesture, if it exists
-                    # first check if there is a transition gesture
-                    for sub_list in transitionGestures:
+                    print("Different Branches")
+                    # if they are not on the same branch, do the shortest chain of transition
+                    # gestures between them, if there is one (each played backwards when it 
+                    # goes the other way between its branches)
+                    transitionRoute = library.route(currentBranch, newBranch)
+                    if len(transitionRoute) > 0:
                         # if transition gesture exists, set the transitionBool as True
                         # the transitionBool will guarantee that the gesture will not change with updateGesture
                         # and store the newGesture to use in the future
-                        # and set the new gesture as transition gesture
-                        if sub_list[0] == currentBranch and sub_list[1] == newBranch: 
-                            transitionBool = True
-                            nextGesture = newGesture
-                            newGesture = sub_list[2]
-                        # if the transition gesture is present but we need to play it backwards
-                        elif sub_list[0] == newBranch and sub_list[1] == currentBranch:
-                            transitionBool = True
-                            nextGesture = newGesture
-                            # get the index of the newGesture
-                            backGesture = sub_list[2]
-                            # find which transition gesture it is
-                            backGesture = transitionList.index(backGesture)
-                            # add 1 and negate it for correct position of the transition
-                            newGesture = -(backGesture+1)
+                        # and set the new gesture as the first transition gesture
+                        transitionBool = True
+                        nextGesture = newGesture
+                        newGesture = transitionRoute[0]
+                        transitionQueue = list(transitionRoute[1:])
                     # change the current branch to new branch
                     currentBranch = newBranch
                     print("Playing transition gesture...")
@@ -457,57 +438,117 @@ def main():
 
                 print("currentGesture is: " + str(currentGesture))
 
-                startPosArray = csvGestureData[oldGesture][currentFrame]
-                endPosArray = csvGestureData[currentGesture][0]
-                numFrames = csvGestureLength[currentGesture]
+                startPosArray = library.frames[oldGesture][currentFrame]
+                endPosArray = library.frames[currentGesture][0]
+                numFrames = library.lengths[currentGesture]
 
-                # Note, if you want linear smoothing between gestures, create arrays 
-                # containing the start and end positions of each object and uncomment
-                # the following line
-                gestureSmooth(sleepTime/2, numObjects, startPosArray, endPosArray)
+                # Cross-fade from where the old gesture is to the start of the new
+                # one, which then starts on time
+                gestureSmooth(scheduler, numObjects, startPosArray, endPosArray, motorIdentification, serialProtocol)
 
                 # BE SURE TO "break" AT THE END OF THE SWITCHING GESTURES LOGIC
                 break   
 
             if transitionBool == True and (currentFrame+1) == numFrames:
-                print "transition finished"
-                transitionBool = False
+                print("transition finished")
                 startPosArray = [0] * numObjects
                 endPosArray = [0] * numObjects
                 oldGesture = currentGesture
-                currentGesture = nextGesture
+                # carry on with the next transition gesture of the chain, or
+                # the gesture we were transitioning to
+                if len(transitionQueue) > 0:
+                    currentGesture = transitionQueue.pop(0)
+                else:
+                    transitionBool = False
+                    currentGesture = nextGesture
                 newGesture = currentGesture
 
                 print("currentGesture is: " + str(currentGesture))
 
-                startPosArray = csvGestureData[oldGesture][currentFrame]
-                endPosArray = csvGestureData[currentGesture][0]
-                numFrames = csvGestureLength[currentGesture]
-
-                # Note, if you want linear smoothing between gestures, create arrays 
-                # containing the start and end positions of each object and uncomment
-                # the following line
-                gestureSmooth(sleepTime/2, numObjects, startPosArray, endPosArray)
+                startPosArray = library.frames[oldGesture][currentFrame]
+                endPosArray = library.frames[currentGesture][0]
+                numFrames = library.lengths[currentGesture]
 
-            endTime = time.time()
-
-            timeDifference = endTime - startTime
-            # print(timeDifference)
+                # Cross-fade to the start of the next gesture and play it from there
+                gestureSmooth(scheduler, numObjects, startPosArray, endPosArray, motorIdentification, serialProtocol)
+                break
 
-            # If rendering the frame on the robot took less time than the sleep
-            # time, subtract the timeDifference from the sleepTime and sleep 
-            # that amount to create the proper frame rate
-            if 0 < timeDifference and timeDifference < sleepTime:
-                time.sleep(sleepTime - timeDifference)
+            # Wait for the next frame's deadline. If rendering the frame on the
+            # robot took longer than the frame rate, skip ahead to the frame 
+            # that is due now, but always play the last frame of a gesture
+            steps = scheduler.nextFrame()
+            if steps > 1:
+                print("Execution time exceeded the frame rate, skipped " + str(steps - 1) + " frames...")
+            if currentFrame + 1 < numFrames:
+                nextFrame = min(currentFrame + steps, numFrames - 1)
+                skippedFrames = nextFrame - currentFrame - 1
+                currentFrame = nextFrame
             else:
-                print("Execution time exceeded the frame rate...")
+                currentFrame += 1
 
-            #time.sleep(0.4)
 
-            # Otherwise, we do not want to sleep as we have already spent more
-            # time than the frame rate
+# Play the gestures compiled into the Arduino's flash with the "playback"
+# serial protocol. The Arduino plays every frame itself, so all that is left
+# here is picking the next gesture with updateGesture() as playGestures()
+# does, and the transition gestures to its branch. flashIds holds the number
+# the Arduino knows each gesture by, see storedGestureIds()
+def playStoredGestures(currentGesture, library, frameRate, flashIds):
+    global newGesture
+    global currentBranch
+    global newBranch
 
-            # startTime = time.time()
+    while True:
+        print("currentGesture is: " + str(currentGesture))
+        playStoredGesture(currentGesture, library, frameRate, flashIds)
+
+        # Every frame of the gesture was played by the time the Arduino
+        # answers, so updateGesture() sees them all at once
+        lastFrame = library.lengths[currentGesture] - 1
+        updateGesture(lastFrame, library, lastFrame)
+        if currentGesture == newGesture:
+            continue
+        print("Switching Gestures...")
+
+        # if they are not on the same branch, play the shortest chain of
+        # transition gestures between them, if there is one
+        if currentBranch != newBranch:
+            print("Different Branches")
+            for transition in library.route(currentBranch, newBranch):
+                print("Playing transition gesture " + str(transition) + "...")
+                playStoredGesture(transition, library, frameRate, flashIds)
+            currentBranch = newBranch
+        currentGesture = newGesture
+
+
+# Ask the Arduino to play a gesture from flash and wait for it to finish,
+# stopping if it never does
+def playStoredGesture(gestureId, library, frameRate, flashIds):
+    duration = library.lengths[gestureId] / float(frameRate)
+    if not gestureProtocol.playGesture(serialPort, flashIds[gestureId], duration):
+        print("Arduino did not finish playing gesture " + str(gestureId))
+        sys.exit()
+
+
+# The number the Arduino plays each gesture by with the "playback" protocol.
+# The sketch holds the gestures in file order, followed by the gestures in
+# reversedGestures (playbackReversedGestures in the configs) played
+# backwards. Stops if a transition gesture has to be played backwards to go
+# back between branches but isn't in flash, rather than jumping between them
+def storedGestureIds(library, numGestures, reversedGestures):
+    flashIds = dict((gestureId, gestureId) for gestureId in range(numGestures))
+    forwardIds = {}
+    for forwardId, backwardId in library.backwardIds.items():
+        forwardIds[backwardId] = forwardId
+        if forwardId in reversedGestures:
+            flashIds[backwardId] = numGestures + list(reversedGestures).index(forwardId)
+
+    for (fromBranch, toBranch), gestureId in sorted(library.transitions.items()):
+        if gestureId not in flashIds:
+            forwardId = forwardIds.get(gestureId, gestureId)
+            print("Going from branch " + str(fromBranch) + " to " + str(toBranch) + " plays transition gesture " +
+                  str(forwardId) + " backwards, add it to playbackReversedGestures and generate the Arduino code again")
+            sys.exit()
+    return flashIds
 
 '''
 Code used for Tkinter GUI